@@ -0,0 +1,282 @@
+""" Benchmark of the negative samplers, the cleaning of their results, the processing of the
+    datasets and the loader iteration, on synthetic hypergraphs and on local ARB datasets.
+    Everything runs offline, on the CPU unless --device says otherwise, and the timings are
+    written as json so that two commits can be compared with --compare.
+
+    python -m benchmarks.bench_samplers --scales small,medium --output bench.json
+    python -m benchmarks.bench_samplers --scales small --compare bench.json
+"""
+import argparse
+import json
+import pathlib
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import warnings
+import numpy as np
+import torch
+from torch import Tensor
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from hyperlink_prediction.datasets import ARBDataset, DatasetLoader, HypergraphBaseData
+from negative_sampling import (
+    ABSizedHypergraphNegativeSampler,
+    CliqueHypergraphNegativeSampler,
+    HypergraphNegativeSampler,
+    MotifHypergraphNegativeSampler
+)
+from negative_sampling.hypergraph_negative_sampling_algorithm import SizedHypergraphNegativeSampler
+from negative_sampling.profiler import SamplerProfiler
+
+#Number of nodes, number of hyperedges and mean hyperedge size of every named scale
+SCALES = {
+    "tiny": (200, 1_000, 3),
+    "small": (2_000, 10_000, 4),
+    "medium": (20_000, 100_000, 4),
+    "large": (200_000, 1_000_000, 4)
+}
+
+Mode = ABSizedHypergraphNegativeSampler.Mode
+DTYPES = {"int32": torch.int32, "int64": torch.int64}
+
+SAMPLERS: Dict[str, Callable[[int, int], HypergraphNegativeSampler]] = {
+    "absized-best": lambda n, seed: ABSizedHypergraphNegativeSampler(n, 0.5, 1, Mode.BEST_EFFORT, generator = seed),
+    "absized-node": lambda n, seed: ABSizedHypergraphNegativeSampler(n, 0.5, 1, Mode.NODE_AWARE, generator = seed),
+    "absized-hyperedge": lambda n, seed: ABSizedHypergraphNegativeSampler(n, 0.5, 1, Mode.HYPEREDGE_AWARE, generator = seed),
+    "absized-beta4": lambda n, seed: ABSizedHypergraphNegativeSampler(n, 2, 4, Mode.HYPEREDGE_AWARE, generator = seed),
+    "absized-bucketed": lambda n, seed: ABSizedHypergraphNegativeSampler(n, 0.5, 1, Mode.HYPEREDGE_AWARE, generator = seed, bucketed = True),
+    "sized": lambda n, seed: SizedHypergraphNegativeSampler(n, generator = seed),
+    "motif": lambda n, seed: MotifHypergraphNegativeSampler(n, generator = seed),
+    "clique": lambda n, seed: CliqueHypergraphNegativeSampler(n, generator = seed),
+    "clique-bucketed": lambda n, seed: CliqueHypergraphNegativeSampler(n, generator = seed, bucketed = True)
+}
+
+
+def synthetic_hypergraph(num_nodes: int, num_hyperedges: int, mean_size: float, distribution: str = "poisson", max_size: int = 32, seed: int = 0) -> Tensor:
+    """ Build a random hypergraph sorted by hyperedge, without repeated nodes in a hyperedge.
+
+        Args:
+            num_nodes (int): The number of nodes the hyperedges are drawn from.
+            num_hyperedges (int): The number of hyperedges.
+            mean_size (float): The mean size of the hyperedges, at least 2.
+            distribution (str, optional): The law of the sizes: 'poisson' (2 plus a Poisson
+                variable), 'uniform' (2 to 2 * mean_size - 2) or 'powerlaw' (a Zipf law tuned
+                to mean_size), every size is clipped to max_size.
+                (default: 'poisson')
+            max_size (int, optional): The largest hyperedge size.
+                (default: 32)
+            seed (int, optional): The seed of the generator.
+                (default: 0)
+    """
+    generator = torch.Generator().manual_seed(seed)
+    if distribution == "poisson":
+        sizes = 2 + torch.poisson(torch.full((num_hyperedges,), float(mean_size) - 2), generator = generator).long()
+    elif distribution == "uniform":
+        sizes = torch.randint(2, max(int(2 * mean_size) - 1, 3), (num_hyperedges,), generator = generator)
+    elif distribution == "powerlaw":
+        support = torch.arange(2, max_size + 1, dtype = torch.float64)
+        #Bisect the exponent whose truncated law has the requested mean
+        low, high = 0.0, 10.0
+        for _ in range(60):
+            exponent = (low + high) / 2
+            weights = support ** -exponent
+            if float((weights * support).sum() / weights.sum()) > mean_size:
+                low = exponent
+            else:
+                high = exponent
+        sizes = support.long()[torch.multinomial(weights, num_hyperedges, replacement = True, generator = generator)]
+    else:
+        raise ValueError(f"Unknown size distribution {distribution}")
+    sizes = sizes.clamp(2, min(max_size, num_nodes))
+    hyperedges = torch.repeat_interleave(torch.arange(num_hyperedges), sizes)
+    nodes = torch.randint(0, num_nodes, (hyperedges.shape[0],), generator = generator)
+    #Drop the nodes drawn twice in a hyperedge, the keys come out sorted by hyperedge
+    keys = torch.unique(hyperedges * num_nodes + nodes)
+    return torch.vstack([keys % num_nodes, torch.div(keys, num_nodes, rounding_mode = "floor")])
+
+
+def write_arb_files(path: pathlib.Path, name: str, edge_index: Tensor) -> None:
+    """ Write edge_index, sorted by hyperedge, as the raw text files of an ARB dataset
+    """
+    path.mkdir(parents = True, exist_ok = True)
+    nverts = torch.bincount(edge_index[1]).numpy()
+    np.savetxt(path / f"{name}-nverts.txt", nverts, fmt = "%d")
+    np.savetxt(path / f"{name}-simplices.txt", edge_index[0].numpy() + 1, fmt = "%d")
+    np.savetxt(path / f"{name}-times.txt", np.arange(nverts.shape[0]), fmt = "%d")
+
+
+def measure(stage: Callable[[], object], device: torch.device) -> Tuple[float, int, object]:
+    """ Run stage once in a stage of a SamplerProfiler measuring the memory, and return its
+        wall time, its peak memory and its output
+    """
+    profiler = SamplerProfiler(memory = True, device = device)
+    with profiler.stage("measure"):
+        output = stage()
+    record = profiler.stages["measure"]
+    return record["total_s"], record["peak_bytes"], output
+
+
+def bench_sampler(name: str, edge_index: Tensor, num_nodes: int, repeat: int, device: torch.device) -> Iterator[dict]:
+    """ Time the fit, the generation and the two cleaning steps of a sampler
+    """
+    stages = {"fit": [], "generate": [], "remove_positive_from_negative": [], "oversample": []}
+    memory = {stage: 0 for stage in stages}
+    edge_index = edge_index.to(device)
+    for r in range(repeat):
+        sampler = SAMPLERS[name](num_nodes, r)
+        sampler.device = device
+        sampler.generator = sampler.make_generator(r)
+        steps = [
+            ("fit", lambda: sampler.fit(edge_index)),
+            ("generate", lambda: sampler.generate(edge_index)),
+            ("remove_positive_from_negative", lambda: result.remove_positive_from_negative()),
+            ("oversample", lambda: result.oversample())
+        ]
+        for stage, step in steps:
+            elapsed, peak, result = measure(step, device)
+            stages[stage].append(elapsed)
+            memory[stage] = max(memory[stage], peak)
+    for stage, times in stages.items():
+        yield {"case": name, "stage": stage, "times": times, "peak_bytes": memory[stage]}
+
+
+def bench_dataset(edge_index: Tensor, repeat: int, batch_size: int, device: torch.device, index_dtype: torch.dtype = torch.int64) -> Iterator[dict]:
+    """ Time the processing of the raw ARB files into the cache, the opening of the cache
+        and an epoch of the loader over the dataset
+    """
+    times = {"process": [], "open": [], "loader_epoch": []}
+    memory = {stage: 0 for stage in times}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as root:
+            write_arb_files(pathlib.Path(root) / "synthetic", "synthetic", edge_index)
+            for stage in ("process", "open"):
+                elapsed, peak, dataset = measure(lambda: ARBDataset("synthetic", root = root, index_dtype = index_dtype), device)
+                times[stage].append(elapsed)
+                memory[stage] = max(memory[stage], peak)
+            elapsed, peak, _ = measure(lambda: iterate(dataset, batch_size), device)
+            times["loader_epoch"].append(elapsed)
+            memory["loader_epoch"] = max(memory["loader_epoch"], peak)
+    for stage, stage_times in times.items():
+        yield {"case": "dataset", "stage": stage, "times": stage_times, "peak_bytes": memory[stage]}
+
+
+def iterate(dataset: HypergraphBaseData, batch_size: int) -> int:
+    loader = DatasetLoader(dataset, batch_size, shuffle = True, relabel = True, pin_memory = False)
+    return sum(edge_index.shape[1] for edge_index, _ in loader)
+
+
+def sources(args) -> Iterator[Tuple[str, str, Tensor, int]]:
+    """ Yield the source, the scale, the edge_index and the number of nodes of every graph
+    """
+    for scale in filter(None, args.scales.split(",")):
+        num_nodes, num_hyperedges, mean_size = SCALES[scale]
+        edge_index = synthetic_hypergraph(num_nodes, num_hyperedges, mean_size, args.distribution, args.max_size, args.seed)
+        yield "synthetic", f"{scale}-{args.distribution}", edge_index.to(DTYPES[args.index_dtype]), num_nodes
+    for name in filter(None, args.arb.split(",")):
+        path = pathlib.Path(args.arb_root) / name
+        #Never download while benchmarking
+        if not path.exists():
+            warnings.warn(f"Skipping {name}: no local copy in {path}")
+            continue
+        dataset = ARBDataset(name, root = args.arb_root, index_dtype = DTYPES[args.index_dtype])
+        edge_index = dataset.edge_index.clone()
+        yield "arb", name, edge_index, int(edge_index[0].max()) + 1
+
+
+def summarize(times: List[float]) -> dict:
+    return {"median_s": statistics.median(times), "min_s": min(times), "mean_s": statistics.fmean(times)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output = True, text = True,
+            cwd = pathlib.Path(__file__).resolve().parent, check = True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure_key(r: dict) -> Tuple[str, ...]:
+    #The runs written before the index type was recorded used int64
+    return (r["source"], r["scale"], r.get("index_dtype", "int64"), r["case"], r["stage"])
+
+
+def compare(results: List[dict], baseline_path: str) -> None:
+    """ Print the ratio of every median time to the one of the same measure, with the same
+        index type, in the baseline
+    """
+    with open(baseline_path, "r") as f:
+        baseline = {measure_key(r): r for r in json.load(f)["results"]}
+    print(f"{'measure':<70} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for r in results:
+        key = measure_key(r)
+        if key in baseline:
+            old, new = baseline[key]["median_s"], r["median_s"]
+            print(f"{'/'.join(key):<70} {old:>10.4f} {new:>10.4f} {new / old if old > 0 else float('inf'):>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default = "small", help = f"Comma separated synthetic scales among {', '.join(SCALES)}")
+    parser.add_argument("--distribution", default = "poisson", choices = ["poisson", "uniform", "powerlaw"])
+    parser.add_argument("--max-size", type = int, default = 32)
+    parser.add_argument("--arb", default = "", help = "Comma separated ARB datasets already saved in --arb-root")
+    parser.add_argument("--arb-root", default = "datasets")
+    parser.add_argument("--samplers", default = ",".join(SAMPLERS), help = "Comma separated samplers to run")
+    parser.add_argument("--no-dataset", action = "store_true", help = "Skip the processing and loader measures")
+    parser.add_argument("--batch-size", type = int, default = 1024)
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--device", default = "cpu")
+    parser.add_argument("--index-dtype", default = "int64", choices = list(DTYPES), help = "Index type of the edge_index")
+    parser.add_argument("--threads", type = int, default = None, help = "torch intra-op threads")
+    parser.add_argument("--output", default = None, help = "Json file where the results are written")
+    parser.add_argument("--compare", default = None, help = "Json file of a previous run to compare with")
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    device = torch.device(args.device)
+    results = []
+    for source, scale, edge_index, num_nodes in sources(args):
+        measures = []
+        for name in filter(None, args.samplers.split(",")):
+            measures.append(bench_sampler(name, edge_index, num_nodes, args.repeat, device))
+        if not args.no_dataset and source == "synthetic":
+            measures.append(bench_dataset(edge_index, args.repeat, args.batch_size, device, DTYPES[args.index_dtype]))
+        for measure_results in measures:
+            for r in measure_results:
+                r = {
+                    "source": source, "scale": scale, "index_dtype": args.index_dtype,
+                    "num_nodes": num_nodes, "num_hyperedges": int(edge_index[1].max()) + 1,
+                    "num_incidences": edge_index.shape[1],
+                    **r, **summarize(r["times"])
+                }
+                results.append(r)
+                print(f"{source}/{scale}/{r['case']}/{r['stage']}: {r['median_s']:.4f}s, {r['peak_bytes'] / 2 ** 20:.1f} MiB", flush = True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "device": str(device),
+            "threads": torch.get_num_threads(),
+            "args": vars(args)
+        },
+        "results": results
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 1)
+    if args.compare is not None:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 from .hypergraph_dataset import ARBDataset
 from .data import HypergraphBaseData
-from .loader import DatasetLoader
+from .loader import DatasetLoader, SizeBucketBatchSampler
 
 __all__ = data_classes = [
     'HypergraphBaseData',
     'ARBDataset',
-    'DatasetLoader'
+    'DatasetLoader',
+    'SizeBucketBatchSampler'
 ]
\ No newline at end of file
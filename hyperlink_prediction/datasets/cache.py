@@ -0,0 +1,128 @@
+import json
+import numpy as np
+import os
+import pathlib
+import torch
+import uuid
+from torch import Tensor
+from typing import Tuple
+from utils.dtypes import check_index_dtype
+
+CACHE_VERSION = 2
+HEADER_FILE = "header.json"
+
+
+def edge_index_file(dtype: torch.dtype) -> str:
+    """ The file of the edge_index stored with the index type dtype, every type has its own
+    """
+    return f"edge-index-{str(dtype).replace('torch.', '')}.npy"
+
+
+def _replace(path: pathlib.Path, write) -> None:
+    """ Write a file through write into a temporary file, then move it over path: the
+        memory maps of the previous file keep its inode, they are never truncated.
+        The file is created with the permissions of any new file, under the umask.
+    """
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _save(path: pathlib.Path, array: np.ndarray) -> None:
+    _replace(path, lambda f: np.save(f, array))
+
+
+def _save_header(path: pathlib.Path, header: dict) -> None:
+    _replace(path / HEADER_FILE, lambda f: f.write(json.dumps(header).encode()))
+
+
+def cache_exists(path: pathlib.Path, dtype: torch.dtype = None) -> bool:
+    """ Tell whether a complete cache is saved in path, the header is written last, and,
+        when dtype is given, whether it holds the edge_index stored with that index type
+    """
+    path = pathlib.Path(path)
+    if not (path / HEADER_FILE).exists():
+        return False
+    with open(path / HEADER_FILE, "r") as f:
+        if json.load(f).get("version") != CACHE_VERSION:
+            return False
+    return dtype is None or (path / edge_index_file(dtype)).exists()
+
+
+def write_cache(path: pathlib.Path, edge_index: Tensor, time_saved: Tensor, dtype: torch.dtype = None) -> None:
+    """ Save a hypergraph in a columnar cache made of raw .npy arrays: the edge_index sorted
+        by hyperedge, the CSR offsets of every hyperedge in it and the timestamps, plus a
+        small json header. Every file is replaced atomically, the caches already open keep
+        reading the previous files.
+
+        Args:
+            path (pathlib.Path): The folder where the cache will be saved.
+            edge_index (Tensor): A tensor where are saved the node's id and the hyperedge's id.
+            time_saved (Tensor): A tensor where are saved the hyperedge's id and its timestamp.
+            dtype (torch.dtype, optional): The index type the edge_index is stored with, see
+                utils.dtypes, the one of edge_index when None. The offsets and the timestamps
+                stay int64, other types are added by add_cache_dtype.
+                (default: None)
+    """
+    path = pathlib.Path(path)
+    path.mkdir(parents = True, exist_ok = True)
+    edge_index = edge_index.cpu()
+    if edge_index.shape[1] > 1 and not bool((edge_index[1, 1:] >= edge_index[1, :-1]).all()):
+        edge_index = edge_index[:, torch.argsort(edge_index[1], stable = True)]
+    num_hyperedges = int(edge_index[1].max()) + 1 if edge_index.shape[1] > 0 else 0
+    num_nodes = int(edge_index[0].max()) + 1 if edge_index.shape[1] > 0 else 0
+    if dtype is not None:
+        edge_index = edge_index.to(check_index_dtype(dtype, num_nodes, num_hyperedges))
+    ptr = np.zeros(num_hyperedges + 1, dtype = np.int64)
+    np.cumsum(np.bincount(edge_index[1].numpy(), minlength = num_hyperedges), out = ptr[1:])
+
+    _save(path / edge_index_file(edge_index.dtype), np.ascontiguousarray(edge_index.numpy()))
+    _save(path / "ptr.npy", ptr)
+    _save(path / "times.npy", np.ascontiguousarray(time_saved.cpu().numpy()))
+    _save_header(path, {
+        "version": CACHE_VERSION,
+        "dtype": str(edge_index.dtype).replace("torch.", ""),
+        "num_nodes": num_nodes,
+        "num_hyperedges": num_hyperedges,
+        "num_incidences": edge_index.shape[1]
+    })
+
+
+def add_cache_dtype(path: pathlib.Path, dtype: torch.dtype) -> None:
+    """ Add to a cache saved by write_cache its edge_index stored with the index type dtype,
+        next to the ones already saved
+
+        Args:
+            path (pathlib.Path): The folder where the cache is saved.
+            dtype (torch.dtype): The index type, see utils.dtypes.
+    """
+    path = pathlib.Path(path)
+    if cache_exists(path, dtype):
+        return
+    edge_index, _, _, header = read_cache(path)
+    check_index_dtype(dtype, header["num_nodes"], header["num_hyperedges"])
+    _save(path / edge_index_file(dtype), np.ascontiguousarray(edge_index.to(dtype).numpy()))
+
+
+def read_cache(path: pathlib.Path, dtype: torch.dtype = None) -> Tuple[Tensor, Tensor, Tensor, dict]:
+    """ Open a cache saved by write_cache. The arrays are memory-mapped copy-on-write and
+        wrapped as tensors without copying, so the pages are loaded lazily and shared by
+        every process of the host which opens the same cache.
+
+        Args:
+            path (pathlib.Path): The folder where the cache is saved.
+            dtype (torch.dtype, optional): The index type of the edge_index, the one it was
+                written with when None.
+                (default: None)
+            return: the edge_index, the time_saved, the CSR offsets of the hyperedges
+                and the header.
+    """
+    path = pathlib.Path(path)
+    with open(path / HEADER_FILE, "r") as f:
+        header = json.load(f)
+    name = edge_index_file(dtype) if dtype is not None else edge_index_file(header["dtype"])
+    edge_index = torch.from_numpy(np.load(path / name, mmap_mode = "c"))
+    ptr = torch.from_numpy(np.load(path / "ptr.npy", mmap_mode = "c"))
+    time_saved = torch.from_numpy(np.load(path / "times.npy", mmap_mode = "c"))
+    return edge_index, time_saved, ptr, header
@@ -1,9 +1,13 @@
 import torch
 import pathlib
+import numpy as np
 from abc import ABC
+from collections import OrderedDict
 from torch.utils.data import Dataset
 from torch import Tensor
-from typing import Tuple
+from typing import List, Tuple
+from .reader import read_integer_array
+from utils.segment import segment_arange, segment_ptr
 
 class HypergraphBaseData(ABC, Dataset):
     """ A class which obtains the the edge_index and time_saved from a dataset
@@ -12,19 +16,49 @@ class HypergraphBaseData(ABC, Dataset):
             dataset_name (string): The dataset's name.
             edge_index (Tensor): A tensor where are saved the node's id.
             time_saved (Tensor): A tensor where are saved the timestamp.
-            nvert_attribute (Tensor): A tensor where are saved the node's attribute.
+            nvert_attribute (Tensor, optional): A tensor where are saved the node's attribute.
+                 (default: None)
             root (string, optional): The folder's name where the dataset will be saved.
                  (default: 'datasets')
+            ptr (Tensor, optional): The CSR offsets of every hyperedge id in edge_index,
+                which must then be sorted by hyperedge. Computed when not given.
+                 (default: None)
+
+        The tensors may be memory-mapped views of a columnar cache (see .cache),
+        in which case they are shared by every process opening the same cache.
     """
 
-    def __init__(self, dataset_name: str, edge_index: Tensor, time_saved: Tensor, nverts_attribute: Tensor, root: str = 'datasets' ):
+    def __init__(self, dataset_name: str, edge_index: Tensor, time_saved: Tensor, nverts_attribute: Tensor = None, root: str = 'datasets', ptr: Tensor = None):
         super(HypergraphBaseData, self).__init__()
         self.dataset_name = dataset_name
         self.root_path = pathlib.Path(root)
         self.dataset_path = self.root_path / dataset_name
+        if ptr is None:
+            edge_index, ptr = self.__index(edge_index, 1)
         self.__edge_index = edge_index
+        self.__ptr = ptr
         self.__time_saved = time_saved
+        self.__time_index = None
+        self.__temporal_index = None
+        self.__windows = OrderedDict()
+        self.window_cache_size = 32
         self.__nverts_attribute = nverts_attribute
+        self.__len = None
+
+    @staticmethod
+    def __index(rows: Tensor, by: int) -> Tuple[Tensor, Tensor]:
+        """ Sort a two rows tensor by the ids of its row by, when needed, and return it with
+            the CSR offsets of every id
+        """
+        if rows.shape[1] == 0:
+            return rows, torch.zeros(1, dtype = torch.long)
+        if not bool((rows[by, 1:] >= rows[by, :-1]).all()):
+            rows = rows[:, torch.argsort(rows[by], stable = True)]
+        return rows, segment_ptr(torch.bincount(rows[by], minlength = int(rows[by, -1]) + 1))
+
+    @property
+    def ptr(self) -> Tensor:
+        return self.__ptr
         
     @property
     def edge_index(self) -> Tensor:
@@ -49,13 +83,118 @@ class HypergraphBaseData(ABC, Dataset):
                     and a list of the index of the node's number,
                     and as second element the time which is contained in the list of the time_stampded.
         """        
-        
-        return self.edge_index[:, self.edge_index[1] == idx].clone(), self.__time_saved[1,self.__time_saved[0] == idx].clone()
+        if idx < 0 or idx + 1 >= self.__ptr.shape[0]:
+            edge_slice = slice(0, 0)
+        else:
+            edge_slice = slice(self.__ptr[idx], self.__ptr[idx + 1])
+        time_saved, time_ptr = self.time_index
+        if idx < 0 or idx + 1 >= time_ptr.shape[0]:
+            time_slice = slice(0, 0)
+        else:
+            time_slice = slice(time_ptr[idx], time_ptr[idx + 1])
+        return self.edge_index[:, edge_slice].clone(), time_saved[1, time_slice].clone()
+
+    def __getitems__(self, indices: List[int]) -> Tuple[Tensor, Tensor]:
+        """ Fetch many hyperedges with a single gather, as collated by DatasetLoader.
+
+            Args:
+                indices (List[int]): the indices of the hyperedges.
+                return: the tuple containing the edge_index of all the hyperedges, in the order
+                    of indices, and a tensor with one row of timestamps per hyperedge.
+                    Both may share memory with the dataset, do not modify them in place.
+        """
+        idx = torch.as_tensor(indices, dtype = torch.long)
+        time_saved, time_ptr = self.time_index
+        if idx.shape[0] == 0:
+            #No rows to infer the number of timestamps from, an empty batch has one column
+            return self.edge_index[:, :0], time_saved[1, :0].view(0, 1)
+        if int(idx[-1] - idx[0]) + 1 == idx.shape[0] and bool((idx[1:] > idx[:-1]).all()):
+            #A run of consecutive hyperedges is a slice, returned without copying
+            first, last = int(idx[0]), int(idx[-1])
+            edge_index = self.edge_index[:, self.__ptr[first]:self.__ptr[last + 1]]
+            times = time_saved[1, time_ptr[first]:time_ptr[last + 1]]
+            return edge_index, times.view(idx.shape[0], -1)
+        counts = self.__ptr[idx + 1] - self.__ptr[idx]
+        edge_index = self.edge_index[:, torch.repeat_interleave(self.__ptr[idx], counts) + segment_arange(counts)]
+        time_counts = time_ptr[idx + 1] - time_ptr[idx]
+        times = time_saved[1, torch.repeat_interleave(time_ptr[idx], time_counts) + segment_arange(time_counts)]
+        return edge_index, times.view(idx.shape[0], -1)
+
+    @property
+    def time_index(self) -> Tuple[Tensor, Tensor]:
+        """ The time_saved sorted by hyperedge with the CSR offsets of every hyperedge,
+            built on first use
+        """
+        if self.__time_index is None:
+            self.__time_index = self.__index(self.__time_saved, 0)
+        return self.__time_index
     
+    @property
+    def temporal_index(self) -> Tuple[Tensor, Tensor]:
+        """ The hyperedge's ids in chronological order with their sorted timestamps,
+            built on first use
+        """
+        if self.__temporal_index is None:
+            order = torch.argsort(self.__time_saved[1], stable = True)
+            self.__temporal_index = self.__time_saved[0, order], self.__time_saved[1, order]
+        return self.__temporal_index
+
+    def window(self, start: int, end: int) -> Tensor:
+        """ Return the ids of the hyperedges whose timestamp is in [start, end),
+            in chronological order, as a slice of the temporal index.
+
+            Args:
+                start (int): The first timestamp of the window.
+                end (int): The timestamp closing the window, excluded.
+        """
+        ids, times = self.temporal_index
+        bounds = torch.searchsorted(times, torch.tensor([start, end], dtype = times.dtype))
+        return ids[bounds[0]:bounds[1]]
+
+    def window_edge_index(self, start: int, end: int) -> Tensor:
+        """ Return the edge_index induced by the hyperedges whose timestamp is in [start, end).
+            The last window_cache_size windows are cached, do not modify them in place.
+
+            Args:
+                start (int): The first timestamp of the window.
+                end (int): The timestamp closing the window, excluded.
+        """
+        key = (start, end)
+        if key in self.__windows:
+            self.__windows.move_to_end(key)
+        else:
+            self.__windows[key] = self.__getitems__(self.window(start, end))[0]
+            while len(self.__windows) > self.window_cache_size:
+                self.__windows.popitem(last = False)
+        return self.__windows[key]
+
+    def temporal_split(self, val_ratio: float = 0.1, test_ratio: float = 0.1) -> Tuple[Tensor, Tensor, Tensor]:
+        """ Split the hyperedges chronologically: the oldest ones for training, then the
+            validation and the test ones. Hyperedges sharing a timestamp always fall in the
+            same split, so the cuts move back to the first hyperedge of their timestamp.
+
+            Args:
+                val_ratio (float, optional): The fraction of hyperedges for validation.
+                    (default: 0.1)
+                test_ratio (float, optional): The fraction of hyperedges for test.
+                    (default: 0.1)
+                return: the ids of the train, validation and test hyperedges.
+        """
+        ids, times = self.temporal_index
+        cuts = []
+        for ratio in (1 - val_ratio - test_ratio, 1 - test_ratio):
+            cut = min(max(int(ids.shape[0] * ratio), 0), ids.shape[0])
+            if cut < ids.shape[0]:
+                cut = int(torch.searchsorted(times, times[cut]))
+            cuts.append(cut)
+        return ids[:cuts[0]], ids[cuts[0]:cuts[1]], ids[cuts[1]:]
+
     def __len__(self) -> int:
-        """Return the number of the node in the hypergraph
+        """Return the number of the hyperedges in the hypergraph
         """
-        return len(torch.unique(self.__edge_index[1]))
+        if self.__len is None:
+            self.__len = int((self.__ptr[1:] > self.__ptr[:-1]).sum())
+        return self.__len
 
     
     def generate_timestamped(self) -> None:
@@ -63,12 +202,6 @@ class HypergraphBaseData(ABC, Dataset):
             the first contains the position in the of the the timestamp 
             the second contains the value of the timestamp
         """
-        timestamped_list = [[],[]]
-        with open(self.dataset_path / (self.dataset_name + "-times.txt"), "r") as f:
-            for i, line in enumerate(f):
-                timestamped = int(line)
-                timestamped_list[0].append(i)
-                timestamped_list[1].append(timestamped)
-
-        self.__time_saved = torch.tensor(timestamped_list)
+        timestamped = read_integer_array(self.dataset_path / (self.dataset_name + "-times.txt"))
+        self.__time_saved = torch.from_numpy(np.vstack([np.arange(timestamped.shape[0], dtype = np.int64), timestamped]))
         torch.save(self.__time_saved, open((self.dataset_path / "times-index.pkl"), "wb")) 
\ No newline at end of file
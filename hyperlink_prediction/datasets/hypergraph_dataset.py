@@ -2,7 +2,10 @@ import gdown
 import tarfile
 import torch
 import pathlib
+import numpy as np
 from .data import HypergraphBaseData
+from .reader import read_integers, read_integer_array
+from .cache import add_cache_dtype, cache_exists, read_cache, write_cache
 from os import remove
 
 class ARBDataset(HypergraphBaseData): 
@@ -12,6 +15,10 @@ class ARBDataset(HypergraphBaseData):
             dataset_name (string): The dataset's name.
             root (string): The root where the dataset will be saved.
                  (default: 'datasets')
+            index_dtype (torch.dtype, optional): The type of the edge_index, torch.int32
+                halves its size for the graphs with less than 2^31 nodes and hyperedges.
+                Every type is saved in the cache next to the others on first use.
+                 (default: torch.int64)
     """
 
     GDRIVE_IDs = {
@@ -25,10 +32,26 @@ class ARBDataset(HypergraphBaseData):
     }
     
 
-    def __init__(self, dataset_name: str, root: str = 'datasets'):
+    def __init__(self, dataset_name: str, root: str = 'datasets', index_dtype: torch.dtype = torch.int64):
         self.dataset_name = dataset_name
         self.dataset_path = pathlib.Path(root) / dataset_name
+        self.cache_path = self.dataset_path / "cache"
+        self.index_dtype = index_dtype
         
+        if not cache_exists(self.cache_path):
+            self.build_cache()
+        elif not cache_exists(self.cache_path, index_dtype):
+            #Every index type has its own file, the open datasets keep reading theirs
+            add_cache_dtype(self.cache_path, index_dtype)
+
+        edge_index, time_saved, ptr, _ = read_cache(self.cache_path, index_dtype)
+            
+        super(ARBDataset, self).__init__(dataset_name, edge_index, time_saved, None, root, ptr)
+        
+    def build_cache(self) -> None:
+        """ Download and process the dataset when needed, then save it in the columnar
+            cache which is memory-mapped by every following load.
+        """
         if not self.dataset_path.exists():
             self.download()
         
@@ -41,9 +64,7 @@ class ARBDataset(HypergraphBaseData):
             self.generate_timestamped()
 
         time_saved = torch.load(open((self.dataset_path / "times-index.pkl"),"rb"))
-            
-        super(ARBDataset, self).__init__(dataset_name, edge_index, time_saved, root)
-        
+        write_cache(self.cache_path, edge_index, time_saved, self.index_dtype)
 
     def download(self) -> None:
         """ Take the dataset from Google Drive through the name of dataset,
@@ -63,18 +84,24 @@ class ARBDataset(HypergraphBaseData):
         """ Process the files of the verts and the simplices in a tensor containing two list
             the first contain the nodes's id
             and the second the index of the nodes's numbers
-            and then serialize the tensor 
+            and then serialize the tensor.
+            The files are parsed in chunks, the hyperedge's ids are expanded from the
+            number of verts of every hyperedge.
         """
-        list = [[],[]]
+        nverts = read_integer_array(self.dataset_path / (self.dataset_name + "-nverts.txt"))
+        num_incidences = int(nverts.sum())
+        edge_index = np.empty((2, num_incidences), dtype = np.int64)
+        edge_index[1] = np.repeat(np.arange(nverts.shape[0], dtype = np.int64), nverts)
 
-        with open(self.dataset_path / (self.dataset_name + "-nverts.txt") , "r") as f:
-            with open(self.dataset_path / (self.dataset_name + "-simplices.txt"), "r") as g:
-                for i, line in enumerate(f):
-                    nverts = int(line) 
-                    for _ in range(nverts):
-                        simplices = int(g.readline()) - 1
-                        list[0].append(simplices)
-                        list[1].append(i)
+        cursor = 0
+        for simplices in read_integers(self.dataset_path / (self.dataset_name + "-simplices.txt")):
+            simplices = simplices[:num_incidences - cursor]
+            edge_index[0, cursor:cursor + simplices.shape[0]] = simplices - 1
+            cursor += simplices.shape[0]
+            if cursor == num_incidences:
+                break
+        if cursor < num_incidences:
+            raise ValueError("The simplices file has fewer nodes than the nverts file declares")
        
-        edge_index = torch.tensor(list)
+        edge_index = torch.from_numpy(edge_index)
         torch.save(edge_index, open((self.dataset_path / "edge-index.pkl"), "wb"))
\ No newline at end of file
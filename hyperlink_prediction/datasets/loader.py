@@ -1,11 +1,54 @@
+import queue
+import threading
 import torch
-from typing import List,Any
-from torch.utils.data import DataLoader
+from torch import Tensor
+from typing import List,Any,Iterator
+from torch.utils.data import DataLoader, Sampler
 from hyperlink_prediction.datasets import HypergraphBaseData, ARBDataset
+from utils.buckets import size_buckets
+
+class SizeBucketBatchSampler(Sampler):
+    """ A batch sampler whose batches only hold hyperedges of one size bucket, so that a
+        batch can be processed as a dense (batch_size, size) matrix without padding.
+        Every hyperedge is loaded once per epoch, the hyperedges without nodes are skipped.
+
+        Args:
+            sizes (Tensor): The size of every hyperedge of the dataset.
+            batch_size (int): How many hyperedges per batch at most.
+            shuffle (bool, optional): Set True to shuffle the hyperedges inside every bucket
+                and the order of the batches at every epoch.
+                (default: False)
+            exact (int, optional): The largest size with a bucket of its own, the larger
+                ones share power of two buckets. Every size has its own bucket when None.
+                (default: None)
+            generator (torch.Generator, optional): The generator used to shuffle.
+                (default: None)
+    """
+
+    def __init__(self, sizes: Tensor, batch_size: int, shuffle: bool = False, exact: int = None, generator: torch.Generator = None):
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.generator = generator
+        nonempty = (sizes > 0).nonzero().flatten()
+        self.buckets = [nonempty[ids] for _, ids in size_buckets(sizes[nonempty], exact)]
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = []
+        for ids in self.buckets:
+            if self.shuffle:
+                ids = ids[torch.randperm(ids.shape[0], generator = self.generator)]
+            batches.extend(torch.split(ids, self.batch_size))
+        order = torch.randperm(len(batches), generator = self.generator) if self.shuffle else range(len(batches))
+        for i in order:
+            yield batches[i].tolist()
+
+    def __len__(self) -> int:
+        return sum((ids.shape[0] + self.batch_size - 1) // self.batch_size for ids in self.buckets)
 
 class DatasetLoader(DataLoader):
     """ A class data loader which merge data object from a dataset 
         to a mini-batch.
+        Every batch is fetched with a single gather through HypergraphBaseData.__getitems__.
         
         Args:
             dataset (HypergraphBaseData): The dataset from which to load the data.
@@ -13,11 +56,47 @@ class DatasetLoader(DataLoader):
                 (default: 1)
             shuffle (bool, optional): Set True to have data reshuffled at every epoch.
                 (default: False)
-            **kwargs: Additional arguments for the class.
+            relabel (bool, optional): Set True to relabel the hyperedges of every batch
+                to 0..batch_size - 1 in the order they are loaded. Consecutive repetitions
+                of the same hyperedge, only possible with a sampler drawing with replacement,
+                are merged.
+                (default: False)
+            prefetch (int, optional): How many batches a background thread loads ahead of
+                the training loop, 0 to load them on demand.
+                (default: 0)
+            bucket_by_size (bool, optional): Set True to batch together hyperedges of the
+                same size bucket (see SizeBucketBatchSampler), with the default exact buckets
+                the edge_index[0] of every batch can be viewed as a (batch, size) matrix.
+                (default: False)
+            bucket_exact (int, optional): The largest size with a bucket of its own when
+                bucket_by_size, every size has its own bucket when None.
+                (default: None)
+            zero_copy (bool, optional): Set True to let the batches of consecutive
+                hyperedges, with shuffle False, be views of the dataset's memory-mapped
+                tensors instead of copies: modifying them in place modifies the dataset.
+                Relabeled or pinned batches are always new tensors.
+                (default: False)
+            **kwargs: Additional arguments for the class, pin_memory defaults to
+                True when CUDA is available.
     """
 
-    def __init__(self, dataset: HypergraphBaseData, batch_size: int = 1, shuffle: bool = False, **kwargs):
+    def __init__(self, dataset: HypergraphBaseData, batch_size: int = 1, shuffle: bool = False, relabel: bool = False, prefetch: int = 0, bucket_by_size: bool = False, bucket_exact: int = None, zero_copy: bool = False, **kwargs):
         kwargs.pop("collate_fn", None)
+        kwargs.setdefault("pin_memory", torch.cuda.is_available())
+        self.relabel = relabel
+        self.prefetch = prefetch
+        self.zero_copy = zero_copy
+
+        if bucket_by_size:
+            kwargs["batch_sampler"] = SizeBucketBatchSampler(
+                dataset.ptr[1:] - dataset.ptr[:-1],
+                batch_size,
+                shuffle,
+                bucket_exact,
+                kwargs.pop("generator", None)
+            )
+            #The batch sampler excludes batch_size and shuffle
+            batch_size, shuffle = 1, False
 
         super().__init__(
             dataset,
@@ -28,4 +107,64 @@ class DatasetLoader(DataLoader):
         )
     
     def collate(self, batch: List[Any]):
-        return torch.hstack([b[0] for b in batch]), torch.vstack([v[1] for v in batch])
\ No newline at end of file
+        #Batches fetched at once through HypergraphBaseData.__getitems__ are already gathered
+        if isinstance(batch, tuple):
+            edge_index, time_saved = batch
+            if not (self.zero_copy or self.pin_memory):
+                #A run of consecutive hyperedges is a view of the dataset, copy it
+                if not self.relabel and edge_index._is_view():
+                    edge_index = edge_index.clone()
+                if time_saved._is_view():
+                    time_saved = time_saved.clone()
+        else:
+            edge_index, time_saved = torch.hstack([b[0] for b in batch]), torch.vstack([v[1] for v in batch])
+        if self.relabel:
+            edge_index = torch.vstack([
+                edge_index[0],
+                torch.unique_consecutive(edge_index[1], return_inverse = True)[1].to(edge_index.dtype)
+            ])
+        return edge_index, time_saved
+
+    def __iter__(self) -> Iterator:
+        if self.prefetch <= 0:
+            return super().__iter__()
+        return self.__prefetch(super().__iter__())
+
+    def __prefetch(self, iterator: Iterator) -> Iterator:
+        """ Load the batches of iterator in a background thread, at most prefetch ahead
+        """
+        buffer = queue.Queue(maxsize = self.prefetch)
+        stop = threading.Event()
+        end = object()
+
+        def put(item) -> bool:
+            #Wait for room until the consumer stops, then give up
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout = 0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for batch in iterator:
+                    if not put((batch, None)):
+                        return
+                put((end, None))
+            except BaseException as error:
+                put((end, error))
+
+        thread = threading.Thread(target = produce, daemon = True)
+        thread.start()
+        try:
+            while True:
+                batch, error = buffer.get()
+                if error is not None:
+                    raise error
+                if batch is end:
+                    return
+                yield batch
+        finally:
+            stop.set()
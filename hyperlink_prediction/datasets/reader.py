@@ -0,0 +1,42 @@
+import numpy as np
+import pathlib
+from typing import Iterator
+
+
+def read_integers(path: pathlib.Path, chunk_size: int = 1 << 24) -> Iterator[np.ndarray]:
+    """ Read a text file of whitespace separated integers, such as the ARB '-nverts.txt',
+        '-simplices.txt' and '-times.txt' files, and yield them as int64 arrays.
+        The file is parsed chunk_size bytes at a time so that the memory spent
+        parsing is bounded by the chunk's size.
+
+        Args:
+            path (pathlib.Path): The path of the file.
+            chunk_size (int, optional): The number of bytes read at a time.
+                (default: 16 MiB)
+    """
+    with open(path, "rb") as f:
+        rest = b""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            #Split after the last complete line, the remainder is parsed with the next chunk
+            cut = chunk.rfind(b"\n") + 1
+            rest = chunk[cut:]
+            if cut > 0:
+                yield np.fromstring(chunk[:cut], dtype = np.int64, sep = " ")
+        if rest.strip():
+            yield np.fromstring(rest, dtype = np.int64, sep = " ")
+
+
+def read_integer_array(path: pathlib.Path, chunk_size: int = 1 << 24) -> np.ndarray:
+    """ Read a whole text file of whitespace separated integers in a single int64 array
+
+        Args:
+            path (pathlib.Path): The path of the file.
+            chunk_size (int, optional): The number of bytes read at a time.
+                (default: 16 MiB)
+    """
+    chunks = list(read_integers(path, chunk_size))
+    return np.concatenate(chunks) if len(chunks) > 0 else np.empty(0, dtype = np.int64)
@@ -2,11 +2,21 @@ import negative_sampling
 from .hypergraph_negative_sampling import HypergraphNegativeSampler
 from .hypergraph_negative_sampling_result import HypergraphNegativeSamplerResult
 from .hypergraph_negative_sampling_algorithm import ABSizedHypergraphNegativeSampler, MotifHypergraphNegativeSampler, CliqueHypergraphNegativeSampler
+from .clique_expansion import CliqueExpansion
+from .hyperedge_set import HyperedgeSet
+from .hypergraph_index import HypergraphIndex
+from .profiler import SamplerProfiler
+from .negative_pool import NegativePool
 
 __all__ = data_classes = [
     "HypergraphNegativeSampler",
     "HypergraphNegativeSamplerResult",
     "ABSizedHypergraphNegativeSampler",
     "MotifHypergraphNegativeSampler",
-    "CliqueHypergraphNegativeSampler"
+    "CliqueHypergraphNegativeSampler",
+    "CliqueExpansion",
+    "HyperedgeSet",
+    "HypergraphIndex",
+    "SamplerProfiler",
+    "NegativePool"
 ] 
\ No newline at end of file
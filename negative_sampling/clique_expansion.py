@@ -0,0 +1,218 @@
+import torch
+from torch import Tensor
+from utils.growable import GrowableTensor
+from utils.segment import segment_arange, segment_ids, segment_ptr, sorted_isin
+
+
+class CliqueExpansion():
+    """ The clique expansion of a hypergraph stored as a CSR adjacency: two distinct nodes
+        are neighbors when they share at least one hyperedge. Memory scales with the number
+        of clique-expanded edges instead of num_node x num_node.
+        The edges inserted later are kept in a few sorted runs of (src * num_node + dst) keys
+        next to the CSR base, merged two by two when they reach a similar size, so an insert
+        costs an amortized O(log) per new edge instead of a full rebuild. The connected
+        components, once built, are kept as a union-find forest merged by the inserted edges.
+
+        Args:
+            edge_index (Tensor): A tensor where are saved the node's id and the hyperedge's id.
+            num_node (int): The number of nodes in the hypergraph.
+    """
+
+    def __init__(self, edge_index: Tensor, num_node: int):
+        self.num_node = num_node
+        keys = self.pairs(edge_index, num_node)
+        self.degree = torch.bincount(torch.div(keys, num_node, rounding_mode = 'floor'), minlength = num_node)
+        self.__runs = []
+        self.__set_base(keys)
+        self.__num_base = keys.shape[0]
+        self.__inserted = GrowableTensor(keys[:0])
+        self.__parent = None
+        self.__size = None
+        self.__pending = []
+
+    @staticmethod
+    def pairs(edge_index: Tensor, num_node: int) -> Tensor:
+        """ Return the sorted unique (src * num_node + dst) keys of the pairs of distinct nodes
+            sharing a hyperedge of edge_index
+        """
+        edge_index = edge_index[:, torch.argsort(edge_index[1], stable = True)]
+        _, segment, degrees = torch.unique_consecutive(edge_index[1], return_inverse = True, return_counts = True)
+        #Pair every incidence with all the incidences of its hyperedge
+        pair_counts = degrees[segment]
+        #The keys need int64 whatever the index type of edge_index
+        src = torch.repeat_interleave(edge_index[0].long(), pair_counts)
+        dst = edge_index[0, torch.repeat_interleave(segment_ptr(degrees)[segment], pair_counts) + segment_arange(pair_counts)].long()
+        keys = src * num_node + dst
+        return torch.unique(keys[src != dst])
+
+    def __set_base(self, keys: Tensor) -> None:
+        #Only the first run, which holds most of the edges, is indexed by row
+        self.__runs[:1] = [keys]
+        self.__col = keys % self.num_node
+        self.rowptr = segment_ptr(torch.bincount(torch.div(keys, self.num_node, rounding_mode = 'floor'), minlength = self.num_node))
+
+    @property
+    def keys(self) -> Tensor:
+        """ The keys of every edge, sorted inside the base and inside every later run
+        """
+        return self.__runs[0] if len(self.__runs) == 1 else torch.cat(self.__runs)
+
+    @property
+    def col(self) -> Tensor:
+        return self.__col if len(self.__runs) == 1 else self.keys % self.num_node
+
+    @property
+    def num_edges(self) -> int:
+        """Return the number of (directed) edges of the clique expansion
+        """
+        return sum(run.shape[0] for run in self.__runs)
+
+    def insert(self, edge_index: Tensor) -> None:
+        """ Add the pairs of nodes sharing a hyperedge of edge_index, in time proportional
+            to the number of pairs up to the amortized merges of the runs
+
+            Args:
+                edge_index (Tensor): A tensor where are saved the node's id and the hyperedge's id.
+        """
+        keys = self.pairs(edge_index, self.num_node)
+        keys = keys[~self.has_key(keys)]
+        if keys.shape[0] == 0:
+            return
+        self.degree.index_add_(0, torch.div(keys, self.num_node, rounding_mode = 'floor'), torch.ones_like(keys))
+        self.__runs.append(keys)
+        self.__inserted.append(keys)
+        if self.__parent is not None:
+            self.__pending.append(keys)
+        while len(self.__runs) > 1 and self.__runs[-2].shape[0] <= 2 * self.__runs[-1].shape[0]:
+            #The runs are disjoint, merging them is a sort
+            merged, _ = torch.sort(torch.cat(self.__runs[-2:]))
+            if len(self.__runs) == 2:
+                self.__runs.pop()
+                self.__set_base(merged)
+            else:
+                self.__runs[-2:] = [merged]
+
+    def inserted(self, since: int) -> Tensor:
+        """ Return the keys of the edges inserted once the clique expansion had since edges,
+            in the order of their insertion
+        """
+        return self.__inserted.tensor[max(since - self.__num_base, 0):]
+
+    @staticmethod
+    def __propagate(label: Tensor, src: Tensor, dst: Tensor) -> Tensor:
+        #Propagate the minimum label along the edges with pointer jumping until stable
+        while True:
+            update = label.scatter_reduce(0, src, label[dst], reduce = 'amin')
+            while True:
+                jumped = update[update]
+                if torch.equal(jumped, update):
+                    break
+                update = jumped
+            if torch.equal(update, label):
+                return label
+            label = update
+
+    def __components(self) -> None:
+        if self.__parent is None:
+            #Propagate the minimum label along every edge, every node then points to its root
+            keys = self.keys
+            self.__parent = self.__propagate(
+                torch.arange(self.num_node, device = keys.device),
+                torch.div(keys, self.num_node, rounding_mode = 'floor'),
+                keys % self.num_node
+            )
+            self.__size = torch.bincount(self.__parent, minlength = self.num_node)
+        elif len(self.__pending) > 0:
+            keys = torch.cat(self.__pending)
+            #Only the roots joined by the new edges are merged, relabeled 0..k - 1 in order
+            roots, inverse = torch.unique(torch.cat([
+                self.__find(torch.div(keys, self.num_node, rounding_mode = 'floor')),
+                self.__find(keys % self.num_node)
+            ]), return_inverse = True)
+            label = self.__propagate(torch.arange(roots.shape[0], device = keys.device), inverse[:keys.shape[0]], inverse[keys.shape[0]:])
+            size = torch.zeros_like(roots).index_add_(0, label, self.__size[roots])
+            self.__parent[roots] = roots[label]
+            self.__size[roots[label]] = size[label]
+        self.__pending = []
+
+    def __find(self, nodes: Tensor) -> Tensor:
+        #Follow the parents up to the roots, then point the given nodes to them
+        root = self.__parent[nodes]
+        while True:
+            up = self.__parent[root]
+            if torch.equal(up, root):
+                break
+            root = up
+        self.__parent[nodes] = root
+        return root
+
+    def component_of(self, nodes: Tensor) -> Tensor:
+        """ The connected component of every given node, labeled by its smallest node. The
+            components are computed on first access by propagating the minimum label along
+            the edges with pointer jumping, after inserts only the components joined by
+            the new edges are merged.
+
+            Args:
+                nodes (Tensor): A 1-D tensor of node's id.
+        """
+        self.__components()
+        return self.__find(nodes.long())
+
+    def component_size_of(self, nodes: Tensor) -> Tensor:
+        """ The number of nodes in the connected component of every given node, see component_of
+        """
+        component = self.component_of(nodes)
+        return self.__size[component]
+
+    @property
+    def component(self) -> Tensor:
+        """ The connected component of every node, see component_of
+        """
+        return self.component_of(torch.arange(self.num_node, device = self.degree.device))
+
+    @property
+    def component_size(self) -> Tensor:
+        """ The number of nodes in the connected component of every node
+        """
+        return self.component_size_of(torch.arange(self.num_node, device = self.degree.device))
+
+    def neighbors(self, nodes: Tensor, total: int = None) -> Tensor:
+        """ Return the concatenation of the neighbor lists of the given nodes
+
+            Args:
+                nodes (Tensor): A 1-D tensor of node's id.
+                total (int, optional): The sum of the degrees of nodes, read from the device
+                    when None. The lists of the appended hyperedges are always read from
+                    the device.
+                    (default: None)
+        """
+        nodes = nodes.long()
+        counts = self.rowptr[nodes + 1] - self.rowptr[nodes]
+        if len(self.__runs) > 1:
+            #The degree counts the appended neighbors as well, they are not in the CSR
+            total = None
+        neighbors = self.__col[torch.repeat_interleave(self.rowptr[nodes], counts, output_size = total) + segment_arange(counts, total)]
+        if len(self.__runs) == 1:
+            return neighbors
+        #Gather the lists of every run, then regroup them by node
+        neighbors, owners = [neighbors], [segment_ids(counts)]
+        for run in self.__runs[1:]:
+            low = torch.searchsorted(run, nodes * self.num_node)
+            counts = torch.searchsorted(run, (nodes + 1) * self.num_node) - low
+            neighbors.append(run[torch.repeat_interleave(low, counts) + segment_arange(counts)] % self.num_node)
+            owners.append(segment_ids(counts))
+        return torch.cat(neighbors)[torch.argsort(torch.cat(owners), stable = True)]
+
+    def has_key(self, keys: Tensor) -> Tensor:
+        """ Tell, for every (src * num_node + dst) key, whether it is an edge
+        """
+        found = sorted_isin(keys, self.__runs[0])
+        for run in self.__runs[1:]:
+            found |= sorted_isin(keys, run)
+        return found
+
+    def has_edge(self, src: Tensor, dst: Tensor) -> Tensor:
+        """ Tell, for every pair (src[i], dst[i]), whether the two nodes are neighbors
+        """
+        return self.has_key(src.long() * self.num_node + dst)
+
@@ -0,0 +1,165 @@
+import torch
+from torch import Tensor
+from typing import Tuple
+from utils.segment import segment_arange, segment_ids, segment_ptr
+
+#Hyperedge hashes are two sums of 31-bit node hashes modulo a Mersenne prime
+_MASK = (1 << 31) - 1
+_PRIME = (1 << 31) - 1
+_SEEDS = ((0x5BD1E995, 0x27D4EB2F), (0x165667B1, 0x61C88647))
+
+
+def _node_hash(nodes: Tensor, seeds: Tuple[int, int]) -> Tensor:
+    """ A multiply-xorshift mix of the node's id kept on 31 bits, so products fit in int64
+    """
+    nodes = nodes.long()
+    x = (nodes ^ (nodes >> 31)) & _MASK
+    x = (x * (seeds[0] & _MASK)) & _MASK
+    x = x ^ (x >> 15)
+    x = (x * (seeds[1] & _MASK)) & _MASK
+    return x ^ (x >> 13)
+
+
+def canonicalize(edge_index: Tensor, num_node: int) -> Tuple[Tensor, Tensor, Tensor]:
+    """ Sort every hyperedge's nodes and relabel the hyperedges to 0..num_hyperedges - 1
+        in the order of their ids.
+
+        Args:
+            edge_index (Tensor): A tensor where are saved the node's id and the hyperedge's id.
+            num_node (int): The number of nodes in the hypergraph.
+            return: the sorted node's id, in the index type of edge_index, the CSR offsets
+                of the hyperedges and their ids.
+    """
+    ids, segment = torch.unique(edge_index[1], return_inverse = True)
+    order = torch.argsort(segment * num_node + edge_index[0])
+    degrees = torch.bincount(segment, minlength = ids.shape[0])
+    return edge_index[0, order], segment_ptr(degrees), ids
+
+
+def hyperedge_hash(nodes: Tensor, ptr: Tensor) -> Tensor:
+    """ Return a 62-bit hash of every hyperedge which does not depend on the order of its nodes
+
+        Args:
+            nodes (Tensor): The node's id grouped by hyperedge.
+            ptr (Tensor): The CSR offsets of the hyperedges in nodes.
+    """
+    degrees = ptr[1:] - ptr[:-1]
+    segment = segment_ids(degrees)
+    sums = []
+    for seeds in _SEEDS:
+        total = torch.zeros(degrees.shape[0], dtype = torch.long, device = nodes.device)
+        total.index_add_(0, segment, _node_hash(nodes, seeds))
+        sums.append(total % _PRIME)
+    sums[0] = (sums[0] + degrees * 0x2545F491) % _PRIME
+    return (sums[0] << 31) | sums[1]
+
+
+def same_nodes(nodes: Tensor, ptr: Tensor, first: Tensor, other_nodes: Tensor, other_ptr: Tensor, second: Tensor) -> Tensor:
+    """ Tell, for every pair, whether the hyperedges first and second hold the same sorted nodes
+
+        Args:
+            nodes (Tensor): The sorted node's id grouped by hyperedge of the first hyperedges.
+            ptr (Tensor): The CSR offsets of the hyperedges in nodes.
+            first (Tensor): The first hyperedge of every pair.
+            other_nodes (Tensor): The sorted node's id grouped by hyperedge of the second hyperedges.
+            other_ptr (Tensor): The CSR offsets of the hyperedges in other_nodes.
+            second (Tensor): The second hyperedge of every pair.
+    """
+    size = ptr[first + 1] - ptr[first]
+    same = size == other_ptr[second + 1] - other_ptr[second]
+    #Compare node by node the pairs of the same degree only
+    size = torch.where(same, size, 0)
+    pair = segment_ids(size)
+    position = segment_arange(size)
+    equal = nodes[ptr[first][pair] + position] == other_nodes[other_ptr[second][pair] + position]
+    mismatches = torch.zeros(first.shape[0], dtype = torch.long, device = nodes.device)
+    mismatches.index_add_(0, pair, (~equal).long())
+    return same & (mismatches == 0)
+
+
+class HyperedgeSet():
+    """ A set of hyperedges, each seen as the set of its nodes, which answers membership
+        queries in bulk. Hyperedges are bucketed by an order independent hash and every
+        hash match is verified node by node, so answers are exact. The hyperedges are kept
+        in a few sorted runs, merged two by two when they reach a similar size, so adding
+        hyperedges costs an amortized O(log) per hyperedge instead of a full rebuild. Every
+        hyperedge is stored once, however many times it is added, so that a probe checks
+        at most one candidate per run and hash.
+
+        Args:
+            edge_index (Tensor): A tensor where are saved the node's id and the hyperedge's id.
+            num_node (int): The number of nodes in the hypergraph.
+    """
+
+    def __init__(self, edge_index: Tensor, num_node: int):
+        self.num_node = num_node
+        #Every run holds the sorted nodes, their CSR offsets, the sorted hashes and their hyperedges
+        self.__runs = []
+        self.add(edge_index)
+
+    def __len__(self) -> int:
+        return sum(run[3].shape[0] for run in self.__runs)
+
+    def add(self, edge_index: Tensor) -> None:
+        """ Insert the hyperedges of edge_index which the set does not hold yet
+
+            Args:
+                edge_index (Tensor): A tensor where are saved the node's id and the hyperedge's id.
+        """
+        if edge_index.shape[1] == 0:
+            return
+        nodes, ptr, _ = canonicalize(edge_index, self.num_node)
+        hashes = hyperedge_hash(nodes, ptr)
+        #Once sorted by hash the repeated hyperedges are next to each other, bar hash
+        #collisions, keep the first of them
+        sorted_hashes, order = torch.sort(hashes, stable = True)
+        repeated = torch.nonzero(sorted_hashes[1:] == sorted_hashes[:-1]).squeeze(1) + 1
+        distinct = torch.ones(order.shape[0], dtype = torch.bool, device = nodes.device)
+        distinct[repeated[same_nodes(nodes, ptr, order[repeated], nodes, ptr, order[repeated - 1])]] = False
+        new = torch.zeros_like(distinct)
+        new[order[distinct]] = True
+        #The runs are disjoint, they never have to be deduplicated when merged
+        for run in self.__runs:
+            new &= ~self.__contains(run, nodes, ptr, hashes)
+        if not bool(new.any()):
+            return
+        degrees = ptr[1:] - ptr[:-1]
+        nodes, ptr = nodes[new[segment_ids(degrees)]], segment_ptr(degrees[new])
+        self.__runs.append((nodes, ptr, *torch.sort(hashes[new])))
+        while len(self.__runs) > 1 and self.__runs[-2][3].shape[0] <= 2 * self.__runs[-1][3].shape[0]:
+            (nodes, ptr, hashes, order), (next_nodes, next_ptr, next_hashes, next_order) = self.__runs[-2:]
+            hashes, position = torch.sort(torch.cat([hashes, next_hashes]))
+            self.__runs[-2:] = [(
+                torch.cat([nodes, next_nodes]),
+                torch.cat([ptr, next_ptr[1:] + ptr[-1]]),
+                hashes,
+                torch.cat([order, next_order + order.shape[0]])[position]
+            )]
+
+    def contains(self, edge_index: Tensor) -> Tensor:
+        """ Tell, for every hyperedge of edge_index taken in the order of its ids, whether the
+            set holds a hyperedge with exactly the same nodes.
+
+            Args:
+                edge_index (Tensor): A tensor where are saved the node's id and the hyperedge's id.
+        """
+        nodes, ptr, _ = canonicalize(edge_index, self.num_node)
+        hashes = hyperedge_hash(nodes, ptr)
+        found = torch.zeros(ptr.shape[0] - 1, dtype = torch.bool, device = nodes.device)
+        for run in self.__runs:
+            found |= self.__contains(run, nodes, ptr, hashes)
+        return found
+
+    @staticmethod
+    def __contains(run: Tuple[Tensor, Tensor, Tensor, Tensor], nodes: Tensor, ptr: Tensor, hashes: Tensor) -> Tensor:
+        run_nodes, run_ptr, run_hashes, run_order = run
+        degrees = ptr[1:] - ptr[:-1]
+        #Every stored hyperedge sharing the hash is a candidate match
+        low = torch.searchsorted(run_hashes, hashes)
+        counts = torch.searchsorted(run_hashes, hashes, right = True) - low
+        query = segment_ids(counts)
+        candidate = run_order[torch.repeat_interleave(low, counts) + segment_arange(counts)]
+        match = same_nodes(nodes, ptr, query, run_nodes, run_ptr, candidate)
+        found = torch.zeros(degrees.shape[0], dtype = torch.bool, device = nodes.device)
+        found[query[match]] = True
+        return found
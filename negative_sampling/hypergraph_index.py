@@ -0,0 +1,120 @@
+import torch
+from torch import Tensor
+from typing import Tuple
+from negative_sampling.clique_expansion import CliqueExpansion
+from negative_sampling.hyperedge_set import HyperedgeSet
+from utils.dtypes import check_index_dtype
+from utils.growable import GrowableTensor
+from utils.segment import segment_ptr
+
+
+class HypergraphIndex():
+    """ A compact index of a positive hypergraph, built once by a sampler's fit and reused
+        by every generate and by the cleaning of the results: the incidences sorted by
+        hyperedge with their CSR offsets, the hyperedge's degrees and size histogram,
+        and, on first use, the hash set of the hyperedges and the clique expansion.
+        Hyperedges can be appended, every structure is then updated in place.
+        The incidences keep the index type of edge_index, int32 halves their size, the
+        offsets and the degrees are int64.
+
+        Args:
+            edge_index (Tensor): A tensor where are saved the node's id and the hyperedge's id.
+            num_node (int): The number of nodes in the hypergraph.
+    """
+
+    def __init__(self, edge_index: Tensor, num_node: int):
+        self.num_node = num_node
+        self.dtype = edge_index.dtype
+        #Keep a reference to the source so that its storage is not reused while indexed
+        self.source = edge_index
+        self.version = edge_index._version
+        edge_index = edge_index[:, torch.argsort(edge_index[1], stable = True)]
+        _, segment, degrees = torch.unique_consecutive(edge_index[1], return_inverse = True, return_counts = True)
+        self.__edge_index = GrowableTensor(edge_index)
+        self.__segment = GrowableTensor(segment.to(self.dtype))
+        self.__degrees = GrowableTensor(degrees)
+        self.__ptr = GrowableTensor(segment_ptr(degrees))
+        self.size_histogram = torch.bincount(degrees)
+        self.__next_id = int(edge_index[1, -1]) + 1 if edge_index.shape[1] > 0 else 0
+        check_index_dtype(self.dtype, num_node, self.__next_id)
+        self.__hyperedge_set = None
+        self.__clique_expansion = None
+
+    @property
+    def edge_index(self) -> Tensor:
+        return self.__edge_index.tensor
+
+    @property
+    def segment(self) -> Tensor:
+        return self.__segment.tensor
+
+    @property
+    def degrees(self) -> Tensor:
+        return self.__degrees.tensor
+
+    @property
+    def ptr(self) -> Tensor:
+        return self.__ptr.tensor
+
+    @property
+    def num_hyperedges(self) -> int:
+        return len(self.__degrees)
+
+    @property
+    def hyperedge_set(self) -> HyperedgeSet:
+        if self.__hyperedge_set is None:
+            self.__hyperedge_set = HyperedgeSet(self.edge_index, self.num_node)
+        return self.__hyperedge_set
+
+    @property
+    def clique_expansion(self) -> CliqueExpansion:
+        if self.__clique_expansion is None:
+            self.__clique_expansion = CliqueExpansion(self.edge_index, self.num_node)
+        return self.__clique_expansion
+
+    def append(self, edge_index: Tensor) -> Tuple[int, int]:
+        """ Append the hyperedges of edge_index after the indexed ones and update, in time
+            proportional to them, the degrees, the size histogram and, when already built, the
+            hash set and the clique expansion. The ids of edge_index only group its nodes,
+            the hyperedges are renumbered after the largest indexed id in the order of their ids,
+            and stored with the index type of the indexed ones.
+
+            Args:
+                edge_index (Tensor): A tensor where are saved the node's id and the hyperedge's id.
+                return: the positions of the first and past the last appended hyperedges.
+        """
+        start = self.num_hyperedges
+        edge_index = edge_index[:, torch.argsort(edge_index[1], stable = True)]
+        _, segment, degrees = torch.unique_consecutive(edge_index[1], return_inverse = True, return_counts = True)
+        check_index_dtype(self.dtype, self.__next_id + degrees.shape[0])
+        edge_index = torch.vstack([edge_index[0].to(self.dtype), (segment + self.__next_id).to(self.dtype)])
+        self.__next_id += degrees.shape[0]
+        self.__edge_index.append(edge_index)
+        self.__segment.append(segment + start)
+        self.__ptr.append(self.ptr[-1] + torch.cumsum(degrees, dim = 0))
+        self.__degrees.append(degrees)
+        histogram = torch.bincount(degrees)
+        if histogram.shape[0] > self.size_histogram.shape[0]:
+            histogram[:self.size_histogram.shape[0]] += self.size_histogram
+            self.size_histogram = histogram
+        else:
+            self.size_histogram[:histogram.shape[0]] += histogram
+        if self.__hyperedge_set is not None:
+            self.__hyperedge_set.add(edge_index)
+        if self.__clique_expansion is not None:
+            self.__clique_expansion.insert(edge_index)
+        #The grown edge_index is the indexed graph from now on
+        self.source = self.edge_index
+        self.version = self.source._version
+        return start, self.num_hyperedges
+
+    def matches(self, edge_index: Tensor) -> bool:
+        """ Tell whether edge_index is the indexed graph: the same storage, shape and
+            strides, not modified in place since the index was built.
+        """
+        return (
+            edge_index.data_ptr() == self.source.data_ptr() and
+            edge_index.shape == self.source.shape and
+            edge_index.stride() == self.source.stride() and
+            edge_index._version == self.version
+        )
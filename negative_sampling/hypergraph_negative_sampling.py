@@ -1,22 +1,191 @@
+import copy
 import torch
-import torch_directml
 import numpy as np
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from torch import Tensor
+from typing import Tuple
+from negative_sampling.hypergraph_index import HypergraphIndex
+from negative_sampling.profiler import NULL_PROFILER, SamplerProfiler
+
+_worker_sampler = None
+
+
+def init_sampler_worker(sampler: "HypergraphNegativeSampler") -> None:
+    """ The initializer of the worker processes, which keep the sampler sent once to them
+    """
+    global _worker_sampler
+    _worker_sampler = sampler
+
+
+def seeded_sampler(seed: int, sampler: "HypergraphNegativeSampler" = None) -> "HypergraphNegativeSampler":
+    """ Return a copy of sampler, or of the worker's sampler when None, drawing with a
+        generator seeded with seed, so that the sampler's own generator is left untouched
+    """
+    sampler = copy.copy(_worker_sampler if sampler is None else sampler)
+    sampler.generator = sampler.make_generator(seed)
+    return sampler
+
+
+def generate_seeded_shard(start: int, end: int, seed: int, sampler: "HypergraphNegativeSampler" = None) -> Tuple[Tensor, ...]:
+    """ Generate the negatives of the hyperedges start to end of the fitted index with a
+        generator of their own, see seeded_sampler
+    """
+    sampler = seeded_sampler(seed, sampler)
+    return sampler.generate_shard(sampler.index, start, end)
 
 #Removed ABC from the inheritance
 class HypergraphNegativeSampler():
 
-    def __init__(self, num_node: int):
+    def __init__(self, num_node: int, generator: torch.Generator | int | None = None):
         self.num_node = num_node
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    
+        self.index = None
+        self.generator = self.make_generator(generator)
+        self.profiler = NULL_PROFILER
+
+    def make_generator(self, generator: torch.Generator | int | None) -> torch.Generator | None:
+        """ Return the generator every random draw of the sampler uses: a seed builds a new
+            generator on the sampler's device, None falls back on the global torch RNG.
+        """
+        if isinstance(generator, int):
+            return torch.Generator(device = self.device).manual_seed(generator)
+        return generator
+
+    def profile(self, enabled: bool = True, **kwargs) -> SamplerProfiler:
+        """ Enable, or disable with enabled False, the profiling of the sampler and of the
+            results it generates from now on. The keyword arguments are the ones of
+            SamplerProfiler, the profiler is returned to read or reset its records.
+        """
+        self.profiler = SamplerProfiler(device = kwargs.pop("device", self.device), **kwargs) if enabled else NULL_PROFILER
+        return self.profiler
+
+    @staticmethod
+    def shard_seed(seed: int, shard: int) -> int:
+        """ Derive the seed of a shard from the seed of the run, well mixed so that
+            neighbouring shards and runs draw unrelated streams
+        """
+        state = np.random.SeedSequence([seed, shard]).generate_state(2, dtype = np.uint32)
+        return (int(state[0]) << 31) ^ int(state[1])
+
+    def fit(self, edge_index: torch.Tensor, *args, **kwargs):
+        """ Build and cache the index of the positive hypergraph, reused by every following
+            generate on the same edge_index and by the cleaning of its results.
+        """
+        with self.profiler.stage("fit"):
+            self.index = HypergraphIndex(edge_index, self.num_node)
+        return self
+
+    def get_index(self, edge_index: torch.Tensor) -> HypergraphIndex:
+        """ Return the cached index of edge_index, rebuilding it when a different graph is passed
+        """
+        if self.index is None or not self.index.matches(edge_index):
+            self.fit(edge_index)
+        return self.index
+
+    def prepare(self, index: HypergraphIndex) -> None:
+        """ Build the lazy parts of index which generate_shard needs, before the sampler is
+            sent to the workers of generate_sharded so that they do not build them again
+        """
+        pass
+
     @abstractmethod
-    def fit(self, *args, **kwargs):
+    def generate_shard(self, index: HypergraphIndex, start: int, end: int) -> Tuple[Tensor, ...]:
+        """ Generate the negatives of the positive hyperedges start to end of index. The first
+            tensor is the negative edge_index with ids unique across shards, every tensor is
+            concatenated over its last dimension with the ones of the other shards.
+        """
         pass
 
     @abstractmethod
-    def generate(self, edge_index: torch.Tensor):
+    def build_result(self, index: HypergraphIndex, *shard, positive: Tensor = None):
+        """ Wrap the tensors of generate_shard in a result whose positive hyperedges are
+            positive, every hyperedge of index when not given
+        """
         pass
+
+    def generate(self, edge_index: torch.Tensor):
+        with self.profiler.stage("generate"):
+            index = self.get_index(edge_index)
+            return self.build_result(index, *self.generate_shard(index, 0, index.num_hyperedges))
+
+    def batch_shard(self, index: HypergraphIndex, edge_index: Tensor) -> Tuple[Tensor, ...]:
+        """ Generate the negatives of a batch of positive hyperedges from the fitted index, in
+            the format of generate_shard with the ids of the batch's hyperedges counted from 0.
+            The samplers whose negatives do not derive from given positives draw as many
+            negatives as the batch has hyperedges.
+        """
+        return self.generate_shard(index, 0, self.profiler.sync(torch.unique, edge_index[1]).shape[0])
+
+    def generate_batch(self, edge_index: torch.Tensor):
+        """ Generate negatives for a batch of positive hyperedges of the fitted hypergraph,
+            without fitting the sampler on the batch. The result's positives are the batch's
+            hyperedges and its cleaning rejects the negatives equal to any fitted positive
+            hyperedge.
+
+            Args:
+                edge_index (Tensor): The positive hyperedges of the batch, nodes of the fitted
+                    hypergraph.
+        """
+        if self.index is None:
+            raise ValueError("The sampler must be fitted before generating batches")
+        with self.profiler.stage("generate_batch"):
+            return self.build_result(self.index, *self.batch_shard(self.index, edge_index), positive = edge_index)
+
+    def update(self, edge_index: torch.Tensor):
+        """ Incremental mode: append the hyperedges of edge_index to the fitted hypergraph,
+            updating its index in place in time proportional to them, and generate negatives
+            for these hyperedges only. The result's positives are the appended hyperedges and
+            its cleaning rejects the negatives equal to any known positive hyperedge.
+            A sampler which was never fitted is fitted on edge_index.
+
+            Args:
+                edge_index (Tensor): The new hyperedges, see HypergraphIndex.append for their ids.
+        """
+        with self.profiler.stage("update"):
+            if self.index is None:
+                self.fit(edge_index)
+                start, end = 0, self.index.num_hyperedges
+            else:
+                start, end = self.index.append(edge_index)
+            index = self.index
+            positive = index.edge_index[:, self.profiler.item(index.ptr[start]):]
+            return self.build_result(index, *self.generate_shard(index, start, end), positive = positive)
+
+    def generate_sharded(self, edge_index: torch.Tensor, num_shards: int, seed: int = 0, num_workers: int = 0):
+        """ Split the positive hyperedges in num_shards contiguous chunks, generate every chunk
+            with a generator seeded from seed and its number, then merge the chunks in order in
+            a single result. The result only depends on seed and num_shards: it is bit-identical
+            whatever the number of workers, and any shard can be regenerated on its own.
+
+            Args:
+                edge_index (Tensor): A tensor where are saved the node's id and the hyperedge's id.
+                num_shards (int): The number of independently seeded chunks.
+                seed (int, optional): The seed of the run.
+                    (default: 0)
+                num_workers (int, optional): How many processes generate the shards, 0 to
+                    generate them on the calling thread.
+                    (default: 0)
+        """
+        if num_shards <= 0:
+            raise ValueError("The number of shards must be positive")
+        with self.profiler.stage("generate_sharded"):
+            return self.__generate_sharded(edge_index, num_shards, seed, num_workers)
+
+    def __generate_sharded(self, edge_index: torch.Tensor, num_shards: int, seed: int, num_workers: int):
+        index = self.get_index(edge_index)
+        bounds = [index.num_hyperedges * s // num_shards for s in range(num_shards + 1)]
+        tasks = [
+            (bounds[s], bounds[s + 1], self.shard_seed(seed, s))
+            for s in range(num_shards) if bounds[s + 1] > bounds[s]
+        ]
+        if num_workers <= 0:
+            shards = [generate_seeded_shard(*task, sampler = self) for task in tasks]
+        else:
+            self.prepare(index)
+            with ProcessPoolExecutor(num_workers, initializer = init_sampler_worker, initargs = (self,)) as executor:
+                shards = list(executor.map(generate_seeded_shard, *zip(*tasks)))
+        return self.build_result(index, *[torch.cat(parts, dim = -1) for parts in zip(*shards)])
     
     @abstractmethod
     def transform(self, edge_index: np.ndarray):
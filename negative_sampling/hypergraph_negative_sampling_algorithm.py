@@ -1,9 +1,17 @@
+import math
 import torch
 import torch_geometric.nn.aggr as aggr
 from enum import Enum
 from torch import Tensor
+from typing import Tuple
 from negative_sampling.hypergraph_negative_sampling import HypergraphNegativeSampler
+from negative_sampling.hypergraph_index import HypergraphIndex
 from negative_sampling.hypergraph_negative_sampling_result import HypergraphNegativeSamplerResult, ABSizedHypergraphNegativeSamplerResult
+from negative_sampling.clique_expansion import CliqueExpansion
+from utils.growable import GrowableTensor
+from utils.buckets import dense_rows, size_buckets
+from utils.dtypes import check_index_dtype
+from utils.segment import random_below, segment_arange, segment_argmin, segment_ids, segment_ptr, sorted_isin
 
 class ABSizedHypergraphNegativeSampler(HypergraphNegativeSampler):
     class Mode(Enum):
@@ -11,8 +19,12 @@ class ABSizedHypergraphNegativeSampler(HypergraphNegativeSampler):
         NODE_AWARE = "node"
         HYPEREDGE_AWARE = "hyperedge"
 
-    def __init__(self, num_node, alpha: float | int = 0.5, beta: int = 1, mode: Mode = Mode.BEST_EFFORT, avoid_duplicate_nodes: bool = True):
-        super().__init__(num_node)
+    #Hyperedge sizes above this one share power of two buckets in the bucketed mode
+    bucket_exact = 16
+
+    def __init__(self, num_node, alpha: float | int = 0.5, beta: int = 1, mode: Mode = Mode.BEST_EFFORT, avoid_duplicate_nodes: bool = True, generator: torch.Generator | int | None = None, bucketed: bool = False):
+        super().__init__(num_node, generator)
+        self.bucketed = bucketed
         self.alpha = alpha
         if self.alpha >= 1 and self.alpha != int(self.alpha):
             raise ValueError("If alpha is greater than or equal to 1, it must be an integer")
@@ -20,98 +32,291 @@ class ABSizedHypergraphNegativeSampler(HypergraphNegativeSampler):
         self.mode = mode
         self.avoide_duplicate_nodes = avoid_duplicate_nodes
 
-    def fit(self, *args):
-        return self
-    
     #Parameter edge_index unused
-    def get_probabilities(self, replace_mask: torch.Tensor, edge_index: torch.Tensor) -> float:
-        probabilities = torch.ones((replace_mask.sum().item(), self.num_node), device = self.device)
-        probabilities /= probabilities.sum(dim = 1, keepdim = True)
+    def get_probabilities(self, edge_index: torch.Tensor) -> Tensor:
+        """ Return the distribution over the nodes from which every replacement is drawn.
+            It is shared by all the replaced slots, the exclusions of the mode are applied
+            while sampling so no (replaced x num_node) matrix is ever built.
+        """
+        probabilities = torch.ones(self.num_node, device = self.device)
+        probabilities /= probabilities.sum()
         return probabilities
     
     def get_replace_mask(self, edge_index: torch.Tensor) -> Tensor:
+        """ Return a mask over the columns of edge_index, which must be sorted by hyperedge,
+            that marks the nodes to replace. Every hyperedge gets exactly alpha replacements
+            (all its nodes if it is smaller) when alpha >= 1, otherwise every node is replaced
+            with probability 1 - alpha conditioned on at least one replacement per hyperedge.
+        """
+        _, segment, degrees = self.profiler.sync(torch.unique_consecutive, edge_index[1], return_inverse = True, return_counts = True)
+        position = segment_arange(degrees, edge_index.shape[1])
         if self.alpha >= 1:
-            replace_mask = torch.zeros(edge_index.shape[1], dtype = torch.bool, device = self.device)
-            """ The degrees return a tensor which for every position return the number of the verts
-                presents in a hyperedge, like the file with the exention nverts.txt
-            """
-            degrees = aggr.SumAggregation()(
-                torch.ones((edge_index.shape[1],1), dtype = torch.float32, device = self.device),
-                edge_index[1]
-            ).flatten().long()
-            cursor = 0 
-            for e in torch.unique(edge_index[1]):
-                if degrees[e] <= self.alpha:
-                    replace_mask[cursor:cursor + degrees[e]] = True
-                else:
-                    choise = torch.randint(0, degrees[e], (self.alpha,), device= self.device)
-                    replace_mask[cursor + choise] = True
-                cursor += degrees[e]
+            #Random rank of every node inside its hyperedge, the first alpha ranks are replaced
+            perm = torch.argsort(torch.rand(edge_index.shape[1], generator = self.generator, device = self.device))
+            perm = perm[torch.argsort(segment[perm], stable = True)]
+            rank = torch.empty_like(position)
+            rank[perm] = position
+            replace_mask = rank < self.alpha
         else:
-            replace_mask = torch.rand(edge_index.shape[1], device=self.device) >= self.alpha
-            while True: #Ensure that at least one node is replaced in all hyperedges
-                unchanged = (aggr.SumAggregation()(
-                    replace_mask.float().view(-1,1),
-                    edge_index[1]
-                ) == 0).flatten().bool()
-                if not unchanged[torch.unique(edge_index[1])].any():
-                    break
-                unchanged = torch.isin(edge_index[1], unchanged.nonzero())
-                replace_mask[unchanged] = torch.rand(unchanged.sum().int().item(), device=self.device) >= self.alpha
-        
+            replace_mask = torch.rand(edge_index.shape[1], generator = self.generator, device = self.device) >= self.alpha
+            if self.alpha > 0:
+                #Ensure that at least one node is replaced in all hyperedges, see first_replaced
+                first = self.first_replaced(degrees)[segment]
+                replace_mask = (replace_mask & (position > first)) | (position == first)
+
         return replace_mask
+
+    def first_replaced(self, degrees: Tensor) -> Tensor:
+        """ Draw, for hyperedges of the given degrees whose nodes are each replaced with
+            probability 1 - alpha, 0 < alpha < 1, conditioned on at least one replacement, the
+            position of the first replaced node. It follows a geometric law truncated to the
+            hyperedge's size, the nodes after it keep their independent draw and the nodes
+            before it are kept.
+        """
+        u = torch.rand(degrees.shape[0], dtype = torch.float64, generator = self.generator, device = self.device)
+        first = torch.floor(
+            torch.log1p(-u * (1 - self.alpha ** degrees.double())) / math.log(self.alpha)
+        ).long()
+        return torch.minimum(first, degrees - 1)
     
-    def generate(self, edge_index: Tensor) -> ABSizedHypergraphNegativeSamplerResult:
-        positive_edge_index = edge_index[:, torch.argsort(edge_index[1])]
-        negative_edge_index = torch.empty((2,0), dtype= torch.long, device= self.device)
-        num_hyperedges = 0
-        global_positives = torch.empty((2,0), dtype=torch.float32, device= self.device)
-        global_replace_mask = torch.empty((0,), dtype=bool, device= self.device)
-        global_replacement = torch.empty((0,) , dtype=torch.long, device=self.device)
-    
-        for _ in range(self.beta):
-            local_edge_index = torch.clone(positive_edge_index)
-            replace_mask = self.get_replace_mask(local_edge_index)
-            probabilities = self.get_probabilities(replace_mask, positive_edge_index)
-            _probabilities = torch.clone(probabilities).detach()
-            if self.mode == self.Mode.BEST_EFFORT:
-                pass
-            elif self.mode == self.Mode.NODE_AWARE:
-                nodes = local_edge_index[0, replace_mask]
-                _probabilities[torch.arange(0, replace_mask.long().sum()), nodes] = 0
-            elif self.mode == self.Mode.HYPEREDGE_AWARE:
-                #Change the probabilities of the node in the hyperedge to 0
-                for e in torch.unique(local_edge_index[1,replace_mask]):
-                    edges = (local_edge_index[1, replace_mask] == 0).nonzero()
-                    nodes = local_edge_index[0, local_edge_index[1] == e]
-                    _probabilities[edges, nodes] = 0
-            else:
-                raise ValueError("Invalid mode")
-            #Sampling
-            _probabilities = _probabilities.sum(dim = 1, keepdim= True)
-            #Avoid sampling duplicate nodes within the same hyperedge
-            if self.avoide_duplicate_nodes: 
-                replacement = torch.empty(replace_mask.sum().int().item(), dtype=torch.long, device= self.device)
-                for e in torch.unique(local_edge_index[1, replace_mask]):
-                    e_mask = local_edge_index[1, replace_mask] == e
-                    replacement[e_mask] = torch.multinomial(_probabilities[e_mask], 1, replacement=False).flatten()
-            else:
-                replacement = torch.multinomial(_probabilities, 1, replacement=True).flatten()
-            local_edge_index[0, replace_mask] = replacement
-            local_edge_index[1] += num_hyperedges
-            num_hyperedges = torch.max(local_edge_index[1]) + 1
-            negative_edge_index = torch.cat([negative_edge_index , local_edge_index], dim = 1)
-            global_positives = torch.cat([global_positives, probabilities], dim = 0)
-            global_replace_mask = torch.cat([global_replace_mask, replace_mask], dim = 0)
-            global_replacement = torch.cat([global_replacement, replacement], dim = 0) 
+    def get_excluded_mask(self, edge_index: Tensor, slots: Tensor, candidates: Tensor, offsets: Tensor, member_keys: Tensor) -> Tensor:
+        """ Tell which candidates cannot replace the node of their slot according to the mode:
+            the replaced node itself for NODE_AWARE and every node of the positive hyperedge
+            for HYPEREDGE_AWARE, looked up in the sorted (hyperedge * num_node + node) keys
+            where offsets holds hyperedge * num_node for every slot.
+            Exclusions are never stored per slot.
+        """
+        if self.mode == self.Mode.BEST_EFFORT:
+            return torch.zeros_like(candidates, dtype = torch.bool)
+        elif self.mode == self.Mode.NODE_AWARE:
+            return candidates == edge_index[0, slots]
+        elif self.mode == self.Mode.HYPEREDGE_AWARE:
+            return sorted_isin(offsets + candidates, member_keys)
+        else:
+            raise ValueError("Invalid mode")
+
+    def get_duplicate_mask(self, replaced_keys: Tensor, kept_keys: Tensor) -> Tensor:
+        """ Tell which replacements repeat a node already in their hyperedge: a kept node
+            or a replacement drawn for an earlier slot of the same hyperedge.
+        """
+        order = torch.argsort(replaced_keys, stable = True)
+        sorted_keys = replaced_keys[order]
+        duplicate = sorted_isin(replaced_keys, kept_keys)
+        duplicate[order[1:]] |= sorted_keys[1:] == sorted_keys[:-1]
+        return duplicate
+
+    def sample_replacements(self, edge_index: Tensor, segment: Tensor, replace_mask: Tensor, probabilities: Tensor) -> Tensor:
+        """ Draw a replacement for every slot of replace_mask from probabilities in one batch
+            for all the hyperedges, then redraw only the slots whose candidate is excluded by
+            the mode or, with avoid_duplicate_nodes, collides inside its hyperedge.
+        """
+        slots = self.profiler.nonzero(replace_mask)
+        if slots.shape[0] == 0:
+            return torch.empty(0, dtype = torch.long, device = self.device)
+        #The keys are widened to int64 whatever the index type of edge_index
+        segment = segment.long()
+        keys = segment * self.num_node + edge_index[0]
+        member_keys, _ = torch.sort(keys)
+        #The replaced slots sort first as -1, which no key equals
+        kept_keys, _ = torch.sort(keys.masked_fill(replace_mask, -1))
+        self.check_replaceable(edge_index, segment, replace_mask, probabilities, slots)
+
+        offsets = segment[slots] * self.num_node
+        replacement = torch.empty(slots.shape[0], dtype = torch.long, device = self.device)
+        rejected = torch.arange(slots.shape[0], device = self.device)
+        while rejected.shape[0] > 0:
+            replacement[rejected] = torch.multinomial(probabilities, rejected.shape[0], replacement = True, generator = self.generator)
+            rejected_mask = torch.zeros(slots.shape[0], dtype = torch.bool, device = self.device)
+            rejected_mask[rejected] = self.get_excluded_mask(edge_index, slots[rejected], replacement[rejected], offsets[rejected], member_keys)
+            if self.avoide_duplicate_nodes:
+                rejected_mask |= self.get_duplicate_mask(offsets + replacement, kept_keys)
+            rejected = self.profiler.nonzero(rejected_mask)
+            self.profiler.count("draws")
+            self.profiler.count("rejected", rejected.shape[0])
+        return replacement
+
+    def sample_replacements_bucketed(self, edge_index: Tensor, probabilities: Tensor) -> Tuple[Tensor, Tensor]:
+        """ The bucketed counterpart of get_replace_mask and sample_replacements: the
+            hyperedges, whose ids in edge_index must be 0..n - 1 in order, are grouped by size
+            in dense (hyperedges, size) matrices where the replaced slots, the exclusions and
+            the duplicate checks are plain row operations, with no scatter over segments.
+            Every replacement is scattered back to its column of edge_index once.
+
+            Args:
+                edge_index (Tensor): The hyperedges to corrupt, sorted by hyperedge.
+                probabilities (Tensor): The distribution the replacements are drawn from.
+                return: the replace mask over the columns of edge_index and the replacements
+                    in the order of its slots.
+        """
+        degrees = self.profiler.sync(torch.bincount, edge_index[1])
+        ptr = segment_ptr(degrees)
+        #Every entry of a bucket is scattered to its column, the ones not replaced to a spare last one
+        spare = edge_index.shape[1]
+        replace_mask = torch.zeros(spare + 1, dtype = torch.bool, device = self.device)
+        buckets = []
+        for width, ids in self.profiler.sync(size_buckets, degrees, self.bucket_exact):
+            rows, positions = dense_rows(edge_index[0], ptr, ids, width)
+            replace = self.get_dense_replace_mask(positions >= 0)
+            target = torch.where(replace, positions, spare).flatten()
+            replace_mask[target] = True
+            buckets.append((rows, positions, replace, target))
+        replace_mask = replace_mask[:spare]
+        slots = self.profiler.nonzero(replace_mask)
+        if slots.shape[0] > 0:
+            self.check_replaceable(edge_index, edge_index[1], replace_mask, probabilities, slots)
+        nodes = torch.cat([edge_index[0], edge_index[0, :1]])
+        for rows, positions, replace, target in buckets:
+            values = self.sample_dense(rows, positions >= 0, replace, probabilities)
+            nodes[target] = values.flatten().to(nodes.dtype)
+        return replace_mask, nodes[slots]
+
+    def get_dense_replace_mask(self, valid: Tensor) -> Tensor:
+        """ The dense counterpart of get_replace_mask over a (hyperedges, width) matrix
+            whose padding is False in valid
+        """
+        column = torch.arange(valid.shape[1], device = self.device)
+        if self.alpha >= 1:
+            #Random rank of every node in its row, the padding ranks last
+            noise = torch.rand(valid.shape, generator = self.generator, device = self.device).masked_fill(~valid, 2)
+            rank = torch.argsort(torch.argsort(noise, dim = 1), dim = 1)
+            return (rank < self.alpha) & valid
+        replace = (torch.rand(valid.shape, generator = self.generator, device = self.device) >= self.alpha) & valid
+        if self.alpha > 0:
+            first = self.first_replaced(valid.sum(dim = 1)).view(-1, 1)
+            replace = (replace & (column > first)) | (column == first)
+        return replace
+
+    def sample_dense(self, rows: Tensor, valid: Tensor, replace: Tensor, probabilities: Tensor) -> Tensor:
+        """ Draw the replaced slots of a dense bucket and redraw, only in the rows which
+            still have some, the slots rejected by get_dense_rejected
+        """
+        column = torch.arange(rows.shape[1], device = self.device)
+        #Every padding gets its own negative value so it never equals another entry
+        values = torch.where(valid, rows, -1 - column)
+        pending = replace.clone()
+        members, _ = torch.sort(values, dim = 1)
+        while True:
+            live = self.profiler.nonzero(pending.any(dim = 1))
+            if live.shape[0] == 0:
+                return values
+            draw = pending[live]
+            live_values = values[live]
+            live_values.masked_scatter_(draw, torch.multinomial(probabilities, self.profiler.item(draw.sum()), replacement = True, generator = self.generator))
+            values[live] = live_values
+            rejected = self.get_dense_rejected(live_values, rows[live], members[live], replace[live])
+            pending[live] = rejected
+            self.profiler.count("draws")
+            self.profiler.count("rejected", rejected.sum())
+
+    def get_dense_rejected(self, values: Tensor, rows: Tensor, members: Tensor, replace: Tensor) -> Tensor:
+        """ Tell which replaced slots of the rows of values are excluded by the mode or,
+            with avoid_duplicate_nodes, repeat a kept node or a slot on their left. rows holds
+            the original nodes and members the sorted original row of every hyperedge.
+        """
+        if self.mode == self.Mode.BEST_EFFORT:
+            rejected = torch.zeros_like(replace)
+        elif self.mode == self.Mode.NODE_AWARE:
+            rejected = values == rows
+        elif self.mode == self.Mode.HYPEREDGE_AWARE:
+            position = torch.searchsorted(members, values).clamp(max = members.shape[1] - 1)
+            rejected = members.gather(1, position) == values
+        else:
+            raise ValueError("Invalid mode")
+        if self.avoide_duplicate_nodes:
+            #Sort every row by value, the kept nodes then the slots from left to right
+            column = torch.arange(values.shape[1], device = self.device)
+            order = torch.argsort(values * (values.shape[1] + 1) + torch.where(replace, column + 1, 0), dim = 1)
+            ordered = values.gather(1, order)
+            repeated = torch.zeros_like(replace)
+            repeated[:, 1:] = ordered[:, 1:] == ordered[:, :-1]
+            rejected |= torch.zeros_like(replace).scatter_(1, order, repeated)
+        return rejected & replace
+
+    def check_replaceable(self, edge_index: Tensor, segment: Tensor, replace_mask: Tensor, probabilities: Tensor, slots: Tensor) -> None:
+        """ Check that every slot, the nonzero positions of replace_mask, can be replaced,
+            otherwise the rejection would never end
+        """
+        #Segment numbers the hyperedges 0..n - 1
+        segment = segment.long()
+        num_hyperedges = self.profiler.item(segment[-1]) + 1
+        if self.mode == self.Mode.NODE_AWARE:
+            left = 1 - probabilities[edge_index[0, slots]]
+        elif self.mode == self.Mode.HYPEREDGE_AWARE:
+            left = 1 - aggr.SumAggregation()(probabilities[edge_index[0]].view(-1, 1), segment, dim_size = num_hyperedges).flatten()[segment[slots]]
+        else:
+            left = probabilities.sum().view(1)
+        if self.profiler.item((left <= 0).any()):
+            raise ValueError("Some nodes cannot be replaced: every node they may be replaced with is excluded")
+        if self.avoide_duplicate_nodes:
+            available = probabilities[edge_index[0]] > 0
+            blocked = available & (~replace_mask | (self.mode == self.Mode.HYPEREDGE_AWARE))
+            #Integer counts per hyperedge
+            per_hyperedge = lambda mask: torch.zeros(num_hyperedges, dtype = torch.long, device = self.device).index_add_(0, segment, mask.long())
+            free = (probabilities > 0).sum() - per_hyperedge(blocked)
+            needed = per_hyperedge(replace_mask)
+            infeasible = needed > free
+            if self.mode == self.Mode.NODE_AWARE:
+                #A single slot whose only free node is the one it replaces
+                infeasible |= (needed == 1) & (free == 1) & (per_hyperedge(available & replace_mask) == 1)
+            if self.profiler.item(infeasible.any()):
+                raise ValueError("Some hyperedges cannot be filled without duplicate nodes")
+
+    def corrupt(self, index: HypergraphIndex, positive_edge_index: Tensor, segment: Tensor, num_hyperedges: int) -> Tuple[Tensor, Tensor, Tensor]:
+        """ Generate the beta negatives of every positive hyperedge, the negatives of round r
+            having the ids r * num_hyperedges + segment.
 
+            Args:
+                index (HypergraphIndex): The index of the fitted hypergraph.
+                positive_edge_index (Tensor): The positive hyperedges, sorted by hyperedge.
+                segment (Tensor): The number 0..num_hyperedges - 1 of the hyperedge of every
+                    incidence.
+                num_hyperedges (int): The number of positive hyperedges.
+        """
+        with self.profiler.stage("get_probabilities"):
+            probabilities = self.get_probabilities(index.edge_index)
+        #All the beta rounds are generated at once, round r holds the hyperedges r * num_hyperedges onward,
+        #in the index type of the fitted hypergraph
+        negative_edge_index = torch.empty((2, self.beta, positive_edge_index.shape[1]), dtype = index.dtype, device = self.device)
+        negative_edge_index[0] = positive_edge_index[0]
+        negative_edge_index[1] = segment + num_hyperedges * torch.arange(self.beta, device = self.device).view(-1, 1)
+        negative_edge_index = negative_edge_index.view(2, -1)
+        if self.bucketed:
+            with self.profiler.stage("sample_replacements_bucketed"):
+                replace_mask, replacement = self.sample_replacements_bucketed(negative_edge_index, probabilities)
+        else:
+            with self.profiler.stage("get_replace_mask"):
+                replace_mask = self.get_replace_mask(negative_edge_index)
+            with self.profiler.stage("sample_replacements"):
+                replacement = self.sample_replacements(negative_edge_index, negative_edge_index[1], replace_mask, probabilities)
+        replacement = replacement.to(index.dtype)
+        negative_edge_index[0].masked_scatter_(replace_mask, replacement)
+        return negative_edge_index, replace_mask, replacement
+
+    def generate_shard(self, index: HypergraphIndex, start: int, end: int) -> Tuple[Tensor, Tensor, Tensor]:
+        check_index_dtype(index.dtype, end * self.beta)
+        lo, hi = self.profiler.item(index.ptr[start]), self.profiler.item(index.ptr[end])
+        negative_edge_index, replace_mask, replacement = self.corrupt(index, index.edge_index[:, lo:hi], index.segment[lo:hi] - start, end - start)
+        #The shard's hyperedges follow the beta rounds of all the previous shards
+        negative_edge_index[1] += start * self.beta
+
+        return negative_edge_index, replace_mask, replacement
+
+    def batch_shard(self, index: HypergraphIndex, edge_index: Tensor) -> Tuple[Tensor, Tensor, Tensor]:
+        #Corrupt the batch's own hyperedges, drawing from the fitted hypergraph
+        edge_index = edge_index[:, torch.argsort(edge_index[1], stable = True)]
+        ids, segment = self.profiler.sync(torch.unique_consecutive, edge_index[1], return_inverse = True)
+        check_index_dtype(index.dtype, ids.shape[0] * self.beta)
+        return self.corrupt(index, edge_index, segment, ids.shape[0])
+
+    def build_result(self, index: HypergraphIndex, negative_edge_index: Tensor, replace_mask: Tensor, replacement: Tensor, positive: Tensor = None) -> ABSizedHypergraphNegativeSamplerResult:
         return ABSizedHypergraphNegativeSamplerResult(
-            global_positives,
-            global_replace_mask,
-            global_replacement,
+            self.get_probabilities(index.edge_index),
+            replace_mask,
+            replacement,
             self,
-            torch.clone(positive_edge_index),
-            negative_edge_index
+            index.edge_index if positive is None else positive,
+            negative_edge_index,
+            index = index
         )
     
 class SizedHypergraphNegativeSampler(ABSizedHypergraphNegativeSampler):
@@ -119,97 +324,433 @@ class SizedHypergraphNegativeSampler(ABSizedHypergraphNegativeSampler):
         super(SizedHypergraphNegativeSampler, self).__init__(num_node, 0, 1,*args, **kwargs)
 
 class MotifHypergraphNegativeSampler(HypergraphNegativeSampler):
+
+    def __init__(self, num_node, batch_size: int = 16384, max_retries: int = 16, generator: torch.Generator | int | None = None):
+        super().__init__(num_node, generator)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.__starts = None
+
+    def feasible_starts(self, A: CliqueExpansion, degrees: Tensor) -> Tuple[Tensor, Tensor, Tensor, Tensor, int]:
+        """ Return what a walk needs to start from a component holding enough nodes: the
+            positive hyperedge's sizes which are not larger than the largest component, the
+            keys of the edges of A whose component is smaller than the largest size sorted by
+            that size, these sizes, the keys of the other edges, which any walk can start
+            from, and the largest size. After inserts in A only the new edges and the ones
+            of the smaller components are sized again, a larger largest size rebuilds them.
+        """
+        if A.num_edges == 0:
+            raise ValueError("The clique expansion has no edge, no motif can be grown")
+        if self.__starts is None or self.__starts["A"] is not A or self.__starts["num_hyperedges"] > degrees.shape[0]:
+            self.__starts = {"A": A, "num_edges": 0, "num_hyperedges": 0, "cap": 2}
+        starts = self.__starts
+        new_degrees = degrees[starts["num_hyperedges"]:]
+        if new_degrees.shape[0] > 0:
+            cap = max(self.profiler.item(new_degrees.max()), starts["cap"])
+            if cap > starts["cap"]:
+                #The edges of components smaller than the new largest size are no longer all feasible
+                starts.update(num_edges = 0, num_hyperedges = 0, cap = cap)
+                new_degrees = degrees
+        if starts["num_edges"] == 0:
+            starts.update(
+                small_keys = A.keys[:0],
+                small_size = A.keys[:0],
+                saturated = GrowableTensor(A.keys[:0]),
+                targets = GrowableTensor(degrees[:0]),
+                excluded = degrees[:0]
+            )
+            keys = A.keys
+        else:
+            keys = torch.cat([starts["small_keys"], A.inserted(starts["num_edges"])])
+        if keys.shape[0] > 0:
+            edge_size = A.component_size_of(torch.div(keys, self.num_node, rounding_mode = 'floor'))
+            saturated = edge_size >= starts["cap"]
+            starts["saturated"].append(keys[self.profiler.nonzero(saturated)])
+            small = self.profiler.nonzero(~saturated)
+            starts["small_size"], order = torch.sort(edge_size[small], stable = True)
+            starts["small_keys"] = keys[small[order]]
+        #The sizes larger than the largest component wait for it to grow
+        largest = starts["cap"] if len(starts["saturated"]) > 0 else self.profiler.item(starts["small_size"][-1])
+        pending = torch.cat([starts["excluded"], new_degrees])
+        starts["targets"].append(pending[self.profiler.nonzero(pending <= largest)])
+        starts["excluded"] = pending[self.profiler.nonzero(pending > largest)]
+        starts.update(num_edges = A.num_edges, num_hyperedges = degrees.shape[0])
+        return starts["targets"].tensor, starts["small_keys"], starts["small_size"], starts["saturated"].tensor, starts["cap"]
+
+    def grow(self, A: CliqueExpansion, degrees: Tensor, num_walks: int, starts: Tuple[Tensor, Tensor, Tensor, Tensor, int] = None) -> Tuple[Tensor, Tensor, Tensor]:
+        """ Grow num_walks motifs in lockstep. Every walk draws a target size from degrees and
+            starts from a random edge of A in a component large enough, then at every step all
+            the unfinished walks add at once a random node adjacent to exactly one of their
+            nodes. The walks which run out of candidates start over with a new size and edge,
+            up to max_retries times, then they fall back on the motif grown so far.
+
+            Args:
+                A (CliqueExpansion): The clique expansion of the positive hypergraph.
+                degrees (Tensor): The sizes of the positive hyperedges.
+                num_walks (int): The number of motifs to grow.
+                starts (Tuple, optional): The output of feasible_starts, computed when not given.
+                    (default: None)
+                return: a (num_walks, max size) tensor of node's id padded with -1,
+                    the size of every motif and the mask of the walks which fell back.
+        """
+        targets, small_keys, small_size, saturated, cap = self.feasible_starts(A, degrees) if starts is None else starts
+        num_small = small_keys.shape[0]
+        target = torch.empty(num_walks, dtype = torch.long, device = self.device)
+        members = torch.full((num_walks, cap), -1, dtype = torch.long, device = self.device)
+        size = torch.empty(num_walks, dtype = torch.long, device = self.device)
+        attempts = torch.zeros(num_walks, dtype = torch.long, device = self.device)
+        fallback = torch.zeros(num_walks, dtype = torch.bool, device = self.device)
+        restart = torch.arange(num_walks, device = self.device)
+        while True:
+            if restart.shape[0] > 0:
+                target[restart] = targets[torch.randint(0, targets.shape[0], (restart.shape[0],), generator = self.generator, device = self.device)]
+                #The edges whose component holds at least target nodes are a suffix of the small
+                #ones followed by the saturated ones
+                first = torch.searchsorted(small_size, target[restart])
+                position = first + random_below(num_small + saturated.shape[0] - first, self.generator)
+                if num_small == 0:
+                    keys = saturated[position]
+                elif saturated.shape[0] == 0:
+                    keys = small_keys[position]
+                else:
+                    keys = torch.where(
+                        position < num_small,
+                        small_keys[position.clamp(max = num_small - 1)],
+                        saturated[(position - num_small).clamp(min = 0)]
+                    )
+                members[restart] = -1
+                members[restart, 0] = torch.div(keys, self.num_node, rounding_mode = 'floor')
+                members[restart, 1] = keys % self.num_node
+                size[restart] = 2
+            active = self.profiler.nonzero(size < target)
+            if active.shape[0] == 0:
+                break
+            self.profiler.count("steps")
+            #Frontier of every active walk: the neighbors of its nodes, keyed by walk * num_node + node
+            walk_members = members[active]
+            valid = self.profiler.nonzero(walk_members.flatten() >= 0)
+            owner = torch.div(valid, walk_members.shape[1], rounding_mode = 'floor')
+            nodes = walk_members.flatten()[valid]
+            degree = A.degree[nodes]
+            num_neighbors = self.profiler.item(degree.sum())
+            frontier = torch.repeat_interleave(owner, degree, output_size = num_neighbors) * self.num_node + A.neighbors(nodes, num_neighbors)
+            keys, count = self.profiler.sync(torch.unique, frontier, return_counts = True)
+            member_keys, _ = torch.sort(owner * self.num_node + nodes)
+            keys = keys[self.profiler.nonzero((count == 1) & ~sorted_isin(keys, member_keys))]
+            #Uniformly pick one candidate per walk, keys are sorted by walk
+            grown, candidate_counts = self.profiler.sync(
+                torch.unique_consecutive,
+                torch.div(keys, self.num_node, rounding_mode = 'floor'),
+                return_counts = True
+            )
+            chosen = segment_ptr(candidate_counts)[:-1] + random_below(candidate_counts, self.generator)
+            failed = torch.ones(active.shape[0], dtype = torch.bool, device = self.device)
+            failed[grown] = False
+            grown = active[grown]
+            members[grown, size[grown]] = keys[chosen] % self.num_node
+            size[grown] += 1
+            failed = active[self.profiler.nonzero(failed)]
+            attempts[failed] += 1
+            exhausted = attempts[failed] > self.max_retries
+            #The walks out of retries stop with the motif grown so far
+            stopped = failed[self.profiler.nonzero(exhausted)]
+            target[stopped] = size[stopped]
+            fallback[stopped] = True
+            restart = failed[self.profiler.nonzero(~exhausted)]
+            self.profiler.count("restarts", restart.shape[0])
+        return members, size, fallback
     
-    def fit(self, edge_index: Tensor, *args):
-        return self
-    
-    def generate(self, edge_index: Tensor) -> HypergraphNegativeSampler:
-        sparse = torch.sparse_coo_tensor(
-            edge_index,
-            torch.ones(edge_index.shape[1], device=self.device),
-            (self.num_node, edge_index.max().item() + 1),
-            device= self.device
-        )
-        A = (sparse @ sparse.T).to_dense()
-        A = A.where(A == 0, 1)#Clique expansion
-        degrees = sparse.sum(dim=0).to_dense().flatten()
-        edges = A.nonzero()
-        generated_hyperedges_count = 0
+    def prepare(self, index: HypergraphIndex) -> None:
+        #The clique expansion, its components and the feasible starts are built on first access
+        self.feasible_starts(index.clique_expansion, index.degrees)
+
+    def generate_shard(self, index: HypergraphIndex, start: int, end: int) -> Tuple[Tensor, Tensor]:
+        if start == end:
+            #No new hyperedge, for example an update without any
+            return torch.empty((2, 0), dtype = index.dtype, device = self.device), torch.empty(0, dtype = torch.bool, device = self.device)
+        with self.profiler.stage("clique_expansion"):
+            A = index.clique_expansion
+            starts = self.feasible_starts(A, index.degrees)
+        degrees = index.degrees
         generated_hyperedges = []
-        unique_hyperedges = torch.unique(edge_index[1])
-        for i in range(unique_hyperedges.shape[0]):
-            while True:
-                degree = degrees[torch.randint(0, degrees.shape[0], (1,))].item()
-                f = edges[torch.randint(0, edges.shape[0], (1,))].flatten()
-                while f.shape[0] < degree:
-                    probabilities = A[f].sum(dim = 0)
-                    probabilities[f] = 0
-                    probabilities = torch.where(probabilities == 1, 1., 0.)
-                    if probabilities.sum() == 0:
-                        break
-                    probabilities /= probabilities.sum()
-                    f = torch.cat([
-                        f,
-                        torch.multinomial(probabilities, 1)
-                    ])
-                if f.shape[0] < degree:
-                    continue
-                break
+        fallbacks = []
+        for batch_start in range(start, end, self.batch_size):
+            with self.profiler.stage("grow"):
+                members, _, fallback = self.grow(A, degrees, min(self.batch_size, end - batch_start), starts)
+            valid = self.profiler.nonzero(members.flatten() >= 0)
+            #The walks run on int64 nodes, the negatives take the index type of the positives
             generated_hyperedges.append(torch.vstack([
-                f,
-                torch.full((1, f.shape[0]),generated_hyperedges_count, device = self.device)
+                members.flatten()[valid].to(index.dtype),
+                (torch.div(valid, members.shape[1], rounding_mode = 'floor') + batch_start).to(index.dtype)
             ]))
-            generated_hyperedges_count += 1
-        
+            fallbacks.append(fallback)
+        return torch.cat(generated_hyperedges, dim = 1), torch.cat(fallbacks)
+
+    def build_result(self, index: HypergraphIndex, negative_edge_index: Tensor, fallback: Tensor, positive: Tensor = None) -> HypergraphNegativeSamplerResult:
+        num_fallbacks = self.profiler.item(fallback.sum())
+        self.profiler.count("fallbacks", num_fallbacks)
         return HypergraphNegativeSamplerResult(
             self,
-            edge_index,
-            torch.cat(generated_hyperedges, dim = 1)
+            index.edge_index if positive is None else positive,
+            negative_edge_index,
+            index = index,
+            num_fallbacks = num_fallbacks
         )
     
 class CliqueHypergraphNegativeSampler(HypergraphNegativeSampler):
 
-    def fit(self, edge_index: Tensor,*args):
-        return self
-    
-    def generate(self, edge_index: torch.Tensor) -> HypergraphNegativeSamplerResult:
-        sparse = torch.sparse_coo_tensor(
-            edge_index,
-            torch.ones(edge_index.shape[1], device = self.device),
-            (self.num_node, edge_index.max().item() + 1),
-            device= self.device
+    def __init__(self, num_node, batch_size: int = 16384, max_retries: int = 16, precompute: bool = True, generator: torch.Generator | int | None = None, bucketed: bool = False):
+        super().__init__(num_node, generator)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.precompute = precompute
+        self.bucketed = bucketed
+        self.__eligibility = None
+
+    def candidates(self, A: CliqueExpansion, edge_index: Tensor, ptr: Tensor, source: Tensor, position: Tensor) -> Tuple[Tensor, Tensor]:
+        """ Return the nodes which can replace the node at position in every source hyperedge,
+            the common neighbors of its remaining nodes other than the removed one, with the
+            sample every candidate belongs to. The candidates are grouped by sample.
+        """
+        if self.bucketed:
+            return self.__candidates_bucketed(A, edge_index, ptr, source, position)
+        size = ptr[source + 1] - ptr[source]
+        num_nodes = self.profiler.item(size.sum())
+        removed_node = edge_index[0, ptr[source] + position]
+        #The remaining nodes of every sample, its nodes but the one at position
+        remaining_size = size - 1
+        remaining_ptr = segment_ptr(remaining_size)
+        rank = segment_arange(remaining_size, num_nodes - source.shape[0])
+        remaining_owner = segment_ids(remaining_size, num_nodes - source.shape[0])
+        rank += rank >= position[remaining_owner]
+        remaining = edge_index[0, ptr[source][remaining_owner] + rank]
+        #Candidates are the neighbors of the remaining node with the fewest neighbors
+        remaining_degree = A.degree[remaining]
+        pivot = remaining[remaining_ptr[:-1] + segment_argmin(remaining_degree, remaining_size)]
+        candidate_counts = A.degree[pivot]
+        num_candidates = self.profiler.item(candidate_counts.sum())
+        candidates = A.neighbors(pivot, num_candidates)
+        owner = segment_ids(candidate_counts, num_candidates)
+        #Keep the candidates adjacent to every remaining node
+        checks = remaining_size[owner]
+        num_checks = self.profiler.item(checks.sum())
+        adjacent = A.has_edge(
+            remaining[torch.repeat_interleave(remaining_ptr[owner], checks, output_size = num_checks) + segment_arange(checks, num_checks)],
+            torch.repeat_interleave(candidates, checks, output_size = num_checks)
         )
+        common = torch.zeros(candidates.shape[0], dtype = torch.long, device = self.device)
+        common.index_add_(0, segment_ids(checks, num_checks), adjacent.long())
+        keep = self.profiler.nonzero((common == checks) & (candidates != removed_node[owner]))
+        return candidates[keep], owner[keep]
 
-        A = (sparse @ sparse.T).to_dense()
+    def __candidates_bucketed(self, A: CliqueExpansion, edge_index: Tensor, ptr: Tensor, source: Tensor, position: Tensor) -> Tuple[Tensor, Tensor]:
+        #The samples are grouped by the size k of their source, whose nodes form a dense (samples, k) matrix
+        size = ptr[source + 1] - ptr[source]
+        found, owners = [], []
+        for k, ids in self.profiler.sync(size_buckets, size):
+            if k < 2:
+                continue
+            rows, _ = dense_rows(edge_index[0], ptr, source[ids], k)
+            removed_node = rows.gather(1, position[ids].view(-1, 1)).flatten()
+            column = torch.arange(k - 1, device = self.device)
+            remaining = rows.gather(1, column + (column >= position[ids].view(-1, 1)).long())
+            #Candidates are the neighbors of the remaining node with the fewest neighbors
+            pivot = remaining.gather(1, torch.argmin(A.degree[remaining], dim = 1, keepdim = True)).flatten()
+            candidate_counts = A.degree[pivot]
+            num_candidates = self.profiler.item(candidate_counts.sum())
+            candidates = A.neighbors(pivot, num_candidates)
+            owner = segment_ids(candidate_counts, num_candidates)
+            #Keep the candidates adjacent to every remaining node
+            adjacent = A.has_edge(remaining[owner].flatten(), torch.repeat_interleave(candidates, k - 1, output_size = num_candidates * (k - 1))).view(-1, k - 1)
+            keep = self.profiler.nonzero(adjacent.all(dim = 1) & (candidates != removed_node[owner]))
+            found.append(candidates[keep])
+            owners.append(ids[owner[keep]])
+        if len(found) == 0:
+            return torch.empty(0, dtype = torch.long, device = self.device), torch.empty(0, dtype = torch.long, device = self.device)
+        owner = torch.cat(owners)
+        order = torch.argsort(owner, stable = True)
+        return torch.cat(found)[order], owner[order]
+
+    def eligibility(self, index: HypergraphIndex) -> Tensor:
+        """ Return the mask of the incidences of index.edge_index whose node can be replaced,
+            the hyperedge having more than one node. With precompute, the mask only keeps the
+            nodes whose removal leaves at least one candidate, it is computed once per index
+            and only for the new hyperedges after an append: the removals which the appended
+            hyperedges made feasible in the older ones stay excluded until the next fit.
+        """
+        return self.removable(index)[0]
+
+    def removable(self, index: HypergraphIndex) -> Tuple[Tensor, Tensor, Tensor, Tensor, Tensor]:
+        """ Return the mask of eligibility and the eligible incidences grouped by hyperedge:
+            their positions in index.edge_index, the hyperedges holding at least one, the
+            position of the first one of every such hyperedge and their number. They are
+            grown with the mask after an append.
+        """
+        if self.__eligibility is None or self.__eligibility[0] is not index:
+            eligible = self.__eligible(index, 0, index.num_hyperedges)
+            groups = self.group(index.segment, eligible)
+            self.__eligibility = (index, index.num_hyperedges, GrowableTensor(eligible), *[GrowableTensor(t) for t in groups])
+        elif self.__eligibility[1] < index.num_hyperedges:
+            _, start, *growables = self.__eligibility
+            eligible = self.__eligible(index, start, index.num_hyperedges)
+            lo = self.profiler.item(index.ptr[start])
+            groups = self.group(index.segment[lo:], eligible, lo, len(growables[1]))
+            for growable, values in zip(growables, (eligible, *groups)):
+                growable.append(values)
+            self.__eligibility = (index, index.num_hyperedges, *growables)
+        return tuple(growable.tensor for growable in self.__eligibility[2:])
+
+    def group(self, segment: Tensor, eligible: Tensor, offset: int = 0, num_slots: int = 0) -> Tuple[Tensor, Tensor, Tensor, Tensor]:
+        """ Group the eligible incidences by hyperedge, see removable, segment being the
+            hyperedge of every incidence. The positions start at offset and the first ones
+            of every hyperedge at num_slots, to be appended after earlier groups.
+        """
+        slots = self.profiler.nonzero(eligible)
+        sources, slot_counts = self.profiler.sync(torch.unique_consecutive, segment[slots].long(), return_counts = True)
+        return slots + offset, sources, segment_ptr(slot_counts)[:-1] + num_slots, slot_counts
+
+    def __eligible(self, index: HypergraphIndex, start: int, end: int) -> Tensor:
+        lo, hi = self.profiler.item(index.ptr[start]), self.profiler.item(index.ptr[end])
+        eligible = index.degrees[index.segment[lo:hi]] > 1
+        if self.precompute:
+            A = index.clique_expansion
+            for batch_start in range(start, end, self.batch_size):
+                hyperedges = torch.arange(batch_start, min(batch_start + self.batch_size, end), device = self.device)
+                hyperedges = hyperedges[self.profiler.nonzero(index.degrees[hyperedges] > 1)]
+                size = index.degrees[hyperedges]
+                #Every node of every hyperedge of the batch is a sample
+                num_samples = self.profiler.item(size.sum())
+                source = torch.repeat_interleave(hyperedges, size, output_size = num_samples)
+                position = segment_arange(size, num_samples)
+                _, owner = self.candidates(A, index.edge_index, index.ptr, source, position)
+                found = torch.zeros(source.shape[0], dtype = torch.bool, device = self.device)
+                found[owner] = True
+                incidence = index.ptr[source] + position - lo
+                eligible[incidence] &= found
+        return eligible
+
+    def outsiders(self, edge_index: Tensor, ptr: Tensor, hyperedge: Tensor) -> Tensor:
+        """ Draw for every hyperedge a uniformly random node which does not belong to it, the
+            r-th node outside is r plus the number of members m_j with m_j - j <= r.
+        """
+        size = ptr[hyperedge + 1] - ptr[hyperedge]
+        if self.profiler.item((size >= self.num_node).any()):
+            raise ValueError("Some hyperedges hold every node, no node can be added to them")
+        total = self.profiler.item(size.sum())
+        owner = segment_ids(size, total)
+        position = segment_arange(size, total)
+        members, _ = torch.sort(owner * self.num_node + edge_index[0, torch.repeat_interleave(ptr[hyperedge], size, output_size = total) + position])
+        shifted = members - position
+        rank = random_below(self.num_node - size, self.generator)
+        below = torch.searchsorted(shifted, torch.arange(hyperedge.shape[0], device = self.device) * self.num_node + rank, right = True)
+        return rank + below - segment_ptr(size)[:-1]
+
+    def sample(self, A: CliqueExpansion, edge_index: Tensor, ptr: Tensor, num_samples: int, eligible: Tensor = None, groups: Tuple[Tensor, Tensor, Tensor, Tensor] = None) -> Tuple[Tensor, Tensor, Tensor, Tensor]:
+        """ Draw num_samples source hyperedges at once among the ones with an eligible node,
+            remove one of their eligible nodes at random and pick a replacement among the
+            common neighbors of the remaining nodes. Only the samples without any candidate
+            draw a new source hyperedge, up to max_retries times, then they fall back on a
+            random node outside their last source hyperedge.
+
+            Args:
+                A (CliqueExpansion): The clique expansion of the positive hypergraph.
+                edge_index (Tensor): The positive edge_index sorted by hyperedge.
+                ptr (Tensor): The CSR offsets of the hyperedges in edge_index.
+                num_samples (int): The number of negative hyperedges to sample.
+                eligible (Tensor, optional): The mask of the incidences which can be removed,
+                    every node of the hyperedges with more than one node when not given.
+                    (default: None)
+                groups (Tuple, optional): The eligible incidences grouped by hyperedge, see
+                    removable, computed from eligible when not given.
+                    (default: None)
+                return: the source hyperedge, the position of the removed node inside it,
+                    the node replacing it and whether the sample fell back, for every sample.
+        """
+        degrees = ptr[1:] - ptr[:-1]
+        if groups is None:
+            segment = segment_ids(degrees, edge_index.shape[1])
+            groups = self.group(segment, (degrees > 1)[segment] if eligible is None else eligible)
+        slots, sources, slot_ptr, slot_counts = groups
+        budget = self.max_retries
+        if slots.shape[0] == 0:
+            #No removal leaves a candidate, every sample falls back on its first draw
+            segment = segment_ids(degrees, edge_index.shape[1])
+            slots, sources, slot_ptr, slot_counts = self.group(segment, (degrees > 1)[segment])
+            budget = 0
+        if slots.shape[0] == 0:
+            raise ValueError("Every hyperedge has a single node, no clique can be extended")
+        hyperedge = torch.empty(num_samples, dtype = torch.long, device = self.device)
+        removed = torch.empty(num_samples, dtype = torch.long, device = self.device)
+        replacement = torch.empty(num_samples, dtype = torch.long, device = self.device)
+        attempts = torch.zeros(num_samples, dtype = torch.long, device = self.device)
+        fallback = torch.zeros(num_samples, dtype = torch.bool, device = self.device)
+        pending = torch.arange(num_samples, device = self.device)
+        while pending.shape[0] > 0:
+            #Randomly sample an hyperedge and one of its eligible nodes for removal
+            pick = torch.randint(0, sources.shape[0], (pending.shape[0],), generator = self.generator, device = self.device)
+            source = sources[pick]
+            slot = slot_ptr[pick] + random_below(slot_counts[pick], self.generator)
+            position = slots[slot] - ptr[source]
+            candidates, owner = self.candidates(A, edge_index, ptr, source, position)
+            #Uniformly pick one candidate per sample, candidates are grouped by sample
+            found, found_counts = self.profiler.sync(torch.unique_consecutive, owner, return_counts = True)
+            chosen = segment_ptr(found_counts)[:-1] + random_below(found_counts, self.generator)
+            hyperedge[pending] = source
+            removed[pending] = position
+            replacement[pending[found]] = candidates[chosen]
+            failed = torch.ones(pending.shape[0], dtype = torch.bool, device = self.device)
+            failed[found] = False
+            pending = pending[self.profiler.nonzero(failed)]
+            attempts[pending] += 1
+            exhausted = attempts[pending] > budget
+            if self.profiler.item(exhausted.any()):
+                gave_up = pending[self.profiler.nonzero(exhausted)]
+                replacement[gave_up] = self.outsiders(edge_index, ptr, hyperedge[gave_up])
+                fallback[gave_up] = True
+                pending = pending[self.profiler.nonzero(~exhausted)]
+            self.profiler.count("draws")
+            self.profiler.count("rejected", pending.shape[0])
+        return hyperedge, removed, replacement, fallback
+    
+    def prepare(self, index: HypergraphIndex) -> None:
+        #The clique expansion is built on first access
+        index.clique_expansion
+        self.removable(index)
+
+    def generate_shard(self, index: HypergraphIndex, start: int, end: int) -> Tuple[Tensor, Tensor]:
+        if start == end:
+            #No new hyperedge, for example an update without any
+            return torch.empty((2, 0), dtype = index.dtype, device = self.device), torch.empty(0, dtype = torch.bool, device = self.device)
+        with self.profiler.stage("clique_expansion"):
+            A = index.clique_expansion
+        with self.profiler.stage("eligibility"):
+            eligible, *groups = self.removable(index)
+        edge_index, degrees, ptr = index.edge_index, index.degrees, index.ptr
 
-        unique_edges = torch.unique(edge_index[1])
-        generated_hyperedges_count = 0
         generated_hyperedges = []
-        for _, in range(unique_edges.shape[0]):
-            while True:
-                #Randomly sample an hyperedge
-                hyperedge = unique_edges[torch.randint(0, unique_edges.shape[0], (1,))]
-                nodes = edge_index[0, edge_index[1] == hyperedge] #Get the nodes in the hyperedge
-                #Randomly sample a node for removal
-                hyperedge_mask = torch.zeros(nodes.shape[0], dtype = torch.bool, device = self.device)
-                hyperedge_mask[0] = True #Randomly sample a node for removal
-                p = aggr.MulAggregation()(
-                    A[nodes[~hyperedge_mask]],
-                    torch.zeros(hyperedge_mask.sum().item(), dtype = torch.int64,device = self.device)
-                ).flatten()
-                p[nodes] = 0
-                p = p.where(p == 0, 1)
-                if p.sum() == 0:
-                    continue
-                p /= p.sum()
-                generated_hyperedges.append(torch.vstack([
-                    torch.hstack([nodes[~hyperedge_mask], torch.multinomial(p,1)]),
-                    torch.full((1, nodes.shape[0]),generated_hyperedges_count, device= self.device)
-                ]))
-                generated_hyperedges_count += 1
-                break
+        fallbacks = []
+        for batch_start in range(start, end, self.batch_size):
+            with self.profiler.stage("sample"):
+                hyperedge, removed, replacement, fallback = self.sample(A, edge_index, ptr, min(self.batch_size, end - batch_start), eligible, groups)
+            #Copy the source hyperedges and swap the removed node with its replacement
+            size = degrees[hyperedge]
+            total = self.profiler.item(size.sum())
+            position = segment_arange(size, total)
+            owner = segment_ids(size, total)
+            nodes = edge_index[0, torch.repeat_interleave(ptr[hyperedge], size, output_size = total) + position]
+            #The copied nodes keep the index type of the positives
+            nodes = torch.where(position == removed[owner], replacement[owner].to(nodes.dtype), nodes)
+            generated_hyperedges.append(torch.vstack([nodes, (owner + batch_start).to(nodes.dtype)]))
+            fallbacks.append(fallback)
+        return torch.cat(generated_hyperedges, dim = 1), torch.cat(fallbacks)
+
+    def build_result(self, index: HypergraphIndex, negative_edge_index: Tensor, fallback: Tensor, positive: Tensor = None) -> HypergraphNegativeSamplerResult:
+        num_fallbacks = self.profiler.item(fallback.sum())
+        self.profiler.count("fallbacks", num_fallbacks)
         return HypergraphNegativeSamplerResult(
             self,
-            edge_index,
-            torch.cat(generated_hyperedges, dim=1)
-        )
\ No newline at end of file
+            index.edge_index if positive is None else positive,
+            negative_edge_index,
+            index = index,
+            num_fallbacks = num_fallbacks
+        )
@@ -1,119 +1,127 @@
 import torch
-import torch_geometric.nn.aggr as aggr
 from negative_sampling.hypergraph_negative_sampling import HypergraphNegativeSampler
+from negative_sampling.hyperedge_set import HyperedgeSet
+from negative_sampling.hypergraph_index import HypergraphIndex
 from abc import ABC
 from torch import Tensor
 
 class HypergraphNegativeSamplerResult(ABC):
 
-    def __init__(self, sampler: HypergraphNegativeSampler, p_edge_index: Tensor, n_edge_index: Tensor, ):
+    def __init__(self, sampler: HypergraphNegativeSampler, p_edge_index: Tensor, n_edge_index: Tensor, index: HypergraphIndex = None, num_fallbacks: int = 0):
         self.sampler = sampler
-        self.__p_edge_index = p_edge_index
-        _, self.__p_edge_index[1] = torch.unique(self.__p_edge_index[1], return_inverse = True) 
+        self.profiler = sampler.profiler
+        #How many negatives the sampler could not draw with its own rule, see its fallback
+        self.num_fallbacks = num_fallbacks
+        #The positive index may be shared with the sampler, relabel a copy
+        p_ids, p_inverse = self.profiler.sync(torch.unique, p_edge_index[1], return_inverse = True)
+        self.__p_edge_index = torch.vstack([p_edge_index[0], p_inverse.to(p_edge_index.dtype)])
+        self.__num_p_edges = p_ids.shape[0]
         self.__n_edge_index = n_edge_index
-        _, self.__n_edge_index[1] = torch.unique(self.__n_edge_index[1], return_inverse = True)         
+        n_ids, self.__n_edge_index[1] = self.profiler.sync(torch.unique, self.__n_edge_index[1], return_inverse = True)
+        self.__num_n_edges = n_ids.shape[0]
+        self.__cache = {}
+        self.index = index
         self.device = sampler.device
 
+    def __set_n_edge_index(self, n_edge_index: Tensor, num_n_edges: int):
+        #Every memoized property depends on the negative hyperedges
+        self.__n_edge_index = n_edge_index
+        self.__num_n_edges = num_n_edges
+        self.__cache.clear()
+
+    def __cached(self, name: str, build):
+        if name not in self.__cache:
+            self.__cache[name] = build()
+        return self.__cache[name]
+
     def remove_positive_from_negative(self):
-        #Negative sparse tensor
-        n_sparse = torch.sparse_coo_tensor(
-            self.__n_edge_index,
-            torch.ones_like(self.__n_edge_index[1], dtype = torch.float32, device = self.device),
-            (self.sampler.num_node, self.num_n_edges),
-            device = self.device
-        ).coalesce()
-        #Positive sparse tensor
-        p_sparse = torch.sparse_coo_tensor(
-            self.__p_edge_index,
-            torch.ones_like(self.__p_edge_index[1], dtype = torch.float32, device = self.device),
-            (self.sampler.num_node, self.num_p_edges),
-            device = self.device
-        ).coalesce()
-
-        #Calcuate the matrix between the negative's nodes and positive's nodes
-        A = n_sparse.T @ p_sparse
-        n_degrees = torch.sparse.sum(n_sparse, dim = 0).to_dense()
-        p_degrees = torch.sparse.sum(p_sparse, dim = 0).to_dense()
-        #Check if in the degree of the negative samples are in the positive samples
-        dmask = n_degrees[A.indices()[0] == p_degrees[A.indices()[1]]]
-        #Check if in the matrix are presents the degree of negative samples
-        vmask = A.values() == n_degrees[A.indices()[0]]
-        mask = ~aggr.SumAggregation()(
-            (vmask & dmask).view(-1,1),
-            A.indices()[0]
-        ).flatten()
-
-        self.num_p_in_n = self.num_n_edges - mask.sum()
-        self.n_in_p_mask = torch.isin(self.__n_edge_index[1], mask.nonzero().flatten())
-        self.__n_edge_index = self.__n_edge_index[:,self.n_in_p_mask]
-        _, self.__n_edge_index[1] = torch.unique(self.__n_edge_index[1], return_inverse = True)
+        with self.profiler.stage("remove_positive_from_negative"):
+            return self.__remove_positive_from_negative()
+
+    def __remove_positive_from_negative(self):
+        #Probe every negative hyperedge in a hash set of the positive ones
+        positives = self.index.hyperedge_set if self.index is not None else HyperedgeSet(self.__p_edge_index, self.sampler.num_node)
+        in_p = self.profiler.sync(positives.contains, self.__n_edge_index)
+        mask = ~in_p
+
+        self.num_p_in_n = in_p.sum()
+        self.n_in_p_mask = mask[self.__n_edge_index[1]]
+        #The kept hyperedges are relabeled in order, without sorting
+        new_ids = torch.cumsum(mask, dim = 0) - 1
+        n_edge_index = self.__n_edge_index[:, self.profiler.nonzero(self.n_in_p_mask)]
+        n_edge_index[1] = new_ids[n_edge_index[1]]
+        self.__set_n_edge_index(n_edge_index, self.__num_n_edges - self.profiler.item(self.num_p_in_n))
         return self
     
     def oversample(self):
-        num_samples = self.num_p_edges - self.num_n_edges
+        with self.profiler.stage("oversample"):
+            return self.__oversample()
+
+    def __oversample(self):
+        num_samples = min(self.num_p_edges - self.num_n_edges, self.num_n_edges)
         if num_samples <= 0:
             self.mask = torch.zeros_like(self.__n_edge_index[1], dtype = torch.bool, device= self.device)
             return self
-        unique_n_indices = torch.unique(self.__n_edge_index[1])
-        #Generate a boolean mask of num_samples
-        e_mask = torch.zeros_like(unique_n_indices, dtype= torch.bool)
-        e_mask[:num_samples] = True
         #Mask of duplicate edges
-        e_mask = e_mask[torch.randperm(e_mask.shape[0])]
-        self.mask = torch.isin(self.__n_edge_index[1], unique_n_indices[e_mask])
+        e_mask = torch.zeros(self.num_n_edges, dtype= torch.bool, device = self.device)
+        e_mask[torch.randperm(self.num_n_edges, generator = self.sampler.generator, device = self.device)[:num_samples]] = True
+        self.mask = e_mask[self.__n_edge_index[1]]
         #Create a temporal negative edge index
-        temp_n_edge_index = self.__n_edge_index[:, self.mask]
-        _, temp_n_edge_index[1] = torch.unique(temp_n_edge_index[1], return_inverse = True)
-        temp_n_edge_index[1] += self.num_n_edges
+        temp_n_edge_index = self.__n_edge_index[:, self.profiler.nonzero(self.mask)]
+        temp_n_edge_index[1] = (torch.cumsum(e_mask, dim = 0) - 1)[temp_n_edge_index[1]] + self.num_n_edges
         
-        self.__n_edge_index = torch.hstack([self.__n_edge_index, temp_n_edge_index])
+        self.__set_n_edge_index(torch.hstack([self.__n_edge_index, temp_n_edge_index]), self.num_n_edges + num_samples)
         
         return self
 
     def clean(self):
-        self.remove_positive_from_negative()
-        self.oversample()
+        with self.profiler.stage("clean"):
+            self.remove_positive_from_negative()
+            self.oversample()
         return self
 
     @property
-    def num_p_edges(self):
-        return torch.unique(self.__p_edge_index[1]).shape[0]
+    def num_p_edges(self) -> int:
+        return self.__num_p_edges
     
     @property
-    def num_n_edges(self):
-        return torch.unique(self.__n_edge_index[1]).shape[0]
+    def num_n_edges(self) -> int:
+        return self.__num_n_edges
     
     @property
-    def num_edges(self):
-        return torch.unique(self.edge_index[1]).shape[0]
+    def num_edges(self) -> int:
+        return self.__num_p_edges + self.__num_n_edges
     
     @property
     def edge_index(self) -> Tensor:
-        max_index = torch.max(self.p_edge_index[1]) + 1
-        n_edge_index = torch.clone(self.n_edge_index)
-        n_edge_index[1] += max_index
-
-        return torch.hstack([self.p_edge_index, n_edge_index])
+        """ The positive hyperedges followed by the negative ones, memoized until the
+            negatives change: do not modify it in place.
+        """
+        def build():
+            n_edge_index = torch.clone(self.n_edge_index)
+            n_edge_index[1] += self.num_p_edges
+            return torch.hstack([self.p_edge_index, n_edge_index])
+        return self.__cached("edge_index", build)
 
     @property
     def y(self) -> Tensor:
-        return torch.vstack([self.y_p, self.y_n])
+        return self.__cached("y", lambda: torch.vstack([self.y_p, self.y_n]))
     
     @property
     def y_p(self) -> Tensor:
-        return torch.ones((torch.unique(self.__p_edge_index[1]).shape[0], 1), device = self.device)
+        return self.__cached("y_p", lambda: torch.ones((self.num_p_edges, 1), device = self.device))
     
     @property
     def y_n(self) -> Tensor:
-        return torch.ones((torch.unique(self.__n_edge_index[1]).shape[0], 1), device = self.device)
+        return self.__cached("y_n", lambda: torch.zeros((self.num_n_edges, 1), device = self.device))
     
     @property
     def negative_mask(self):
-        return ~self.y.type(torch.bool).flatten()
+        return self.__cached("negative_mask", lambda: ~self.y.type(torch.bool).flatten())
     
     @property
     def positve_mask(self):
-        return self.y.type(torch.bool).flatten()
+        return self.__cached("positive_mask", lambda: self.y.type(torch.bool).flatten())
     
     def __repr__(self):
         return self.edge_index.__repr__()
@@ -128,27 +136,36 @@ class HypergraphNegativeSamplerResult(ABC):
     
 class ABSizedHypergraphNegativeSamplerResult(HypergraphNegativeSamplerResult):
 
-    def __init__(self, p: torch.Tensor, replace_mask: torch.Tensor, replacement: torch.Tensor, *args, **kwargs):
+    def __init__(self, probabilities: torch.Tensor, replace_mask: torch.Tensor, replacement: torch.Tensor, *args, **kwargs):
         super().__init__(*args,**kwargs)
-        self.p = p
+        self.probabilities = probabilities
         self.replace_mask = replace_mask
         self.replacement = replacement
 
+    @property
+    def p(self) -> Tensor:
+        """ The distribution every replacement was drawn from, one row per replaced slot.
+            The rows are a broadcast view of the shared distribution, nothing is materialized.
+        """
+        return self.probabilities.expand(self.replacement.shape[0], -1)
+
     def remove_positive_from_negative(self):
-        super().remove_positive_from_negative()
-        self.replacement = self.replacement[(self.replace_mask & self.n_in_p_mask)[self.replace_mask]]
-        self.p = self.p[(self.replace_mask & self.mask)[self.replace_mask]]
-        self.replace_mask = self.replace_mask[self.n_in_p_mask]
+        with self.profiler.stage("remove_positive_from_negative"):
+            super().remove_positive_from_negative()
+            #The replacements follow the replaced slots, keep the ones of the kept slots
+            replaced = self.profiler.nonzero(self.replace_mask)
+            self.replacement = self.replacement[self.profiler.nonzero(self.n_in_p_mask[replaced])]
+            self.replace_mask = self.replace_mask[self.profiler.nonzero(self.n_in_p_mask)]
         
         return self
     
     def oversample(self):
-        super().oversample()
-        temp_replacement = self.replacement[(self.replace_mask & self.mask)[self.replace_mask]]
-        temp_p = self.p[(self.replace_mask & self.mask)[self.replace_mask]]
-        temp_replace_mask = self.replace_mask[self.mask]
-        self.replacement = torch.hstack([self.replacement, temp_replacement])
-        self.p = torch.vstack([self.p, temp_p])
-        self.replace_mask = torch.hstack([self.replace_mask, temp_replace_mask])
+        with self.profiler.stage("oversample"):
+            super().oversample()
+            replaced = self.profiler.nonzero(self.replace_mask)
+            temp_replacement = self.replacement[self.profiler.nonzero(self.mask[replaced])]
+            temp_replace_mask = self.replace_mask[self.profiler.nonzero(self.mask)]
+            self.replacement = torch.hstack([self.replacement, temp_replacement])
+            self.replace_mask = torch.hstack([self.replace_mask, temp_replace_mask])
 
         return self
\ No newline at end of file
@@ -0,0 +1,248 @@
+import math
+import threading
+import torch
+from concurrent.futures import ProcessPoolExecutor
+from torch import Tensor
+from typing import Tuple
+from negative_sampling.hypergraph_negative_sampling import HypergraphNegativeSampler, generate_seeded_shard, init_sampler_worker
+from utils.segment import segment_arange, segment_ids, segment_ptr
+
+
+class NegativePool():
+    """ A bounded buffer of cleaned negative hyperedges which a background thread keeps
+        full, so that the training loop draws negatives at a steady rate whatever the cost
+        of the sampler. Every refill generates one round of negatives for a chunk of the
+        positive hyperedges, starting at a random one and wrapping around, sized after the
+        free space of the pool and the number of negatives the last round yielded per
+        positive. The positive negatives are removed and the round is inserted in a random
+        order. The rounds run on the background thread or, with num_workers, in worker
+        processes, round i with the seed seed + i. Which negatives a draw returns also
+        depends on the timing of the refills, the draws are not reproducible.
+
+        A negative leaves the pool once drawn max_reuse times or, with max_age, once that
+        many draws happened since it was inserted. When a round does not fit, the oldest
+        negatives are evicted first with eviction "age", the least recently drawn first
+        with eviction "lru", the ones never drawn counting as drawn when inserted. The ties
+        are broken by the random order of insertion.
+
+        Args:
+            sampler (HypergraphNegativeSampler): The sampler generating the negatives, it is
+                fitted on edge_index and then only used by the pool.
+            edge_index (Tensor): The positive hypergraph.
+            capacity (int): The largest number of negatives held.
+            max_reuse (int, optional): How many times a negative can be drawn, unlimited
+                when None.
+                (default: 1)
+            max_age (int, optional): How many draws a negative stays in the pool, unlimited
+                when None.
+                (default: None)
+            eviction (str, optional): "age" or "lru", the negatives evicted first when a
+                round does not fit.
+                (default: "age")
+            num_workers (int, optional): How many processes generate the rounds, 0 to
+                generate them on the background thread.
+                (default: 0)
+            seed (int, optional): The seed of the first round, the draws use seed as well.
+                (default: 0)
+    """
+
+    def __init__(self, sampler: HypergraphNegativeSampler, edge_index: Tensor, capacity: int, max_reuse: int = 1, max_age: int = None, eviction: str = "age", num_workers: int = 0, seed: int = 0):
+        if capacity <= 0:
+            raise ValueError("The capacity must be positive")
+        if eviction not in ("age", "lru"):
+            raise ValueError("Invalid eviction, it must be 'age' or 'lru'")
+        self.sampler = sampler
+        self.capacity = capacity
+        self.max_reuse = max_reuse
+        self.max_age = max_age
+        self.eviction = eviction
+        self.num_workers = num_workers
+        self.seed = seed
+        self.generator = torch.Generator().manual_seed(seed)
+        self.num_rounds = 0
+        self.num_draws = 0
+        self.num_evicted = 0
+        #How many negatives the last round yielded per positive hyperedge
+        self.__yield = 1.0
+        sampler.fit(edge_index)
+        sampler.prepare(sampler.index)
+        dtype = sampler.index.dtype
+        #The negatives as CSR, with how many times, when they were inserted and last drawn
+        self.__nodes = torch.empty(0, dtype = dtype)
+        self.__ptr = torch.zeros(1, dtype = torch.long)
+        self.__uses = torch.empty(0, dtype = torch.long)
+        self.__inserted = torch.empty(0, dtype = torch.long)
+        self.__drawn = torch.empty(0, dtype = torch.long)
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__stop = False
+        self.__error = None
+
+    def __len__(self) -> int:
+        return self.__uses.shape[0]
+
+    def __enter__(self) -> "NegativePool":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def start(self) -> "NegativePool":
+        """ Start the background refills, once
+        """
+        if self.__thread is None:
+            self.__stop = False
+            self.__thread = threading.Thread(target = self.__refill, daemon = True)
+            self.__thread.start()
+        return self
+
+    def close(self) -> None:
+        """ Stop the background refills, the round being generated is dropped
+        """
+        with self.__condition:
+            self.__stop = True
+            self.__condition.notify_all()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __refill(self) -> None:
+        executor = ProcessPoolExecutor(self.num_workers, initializer = init_sampler_worker, initargs = (self.sampler,)) if self.num_workers > 0 else None
+        try:
+            while True:
+                with self.__condition:
+                    self.__condition.wait_for(lambda: self.__stop or len(self) < self.capacity)
+                    if self.__stop:
+                        return
+                    seed = self.seed + self.num_rounds
+                    free = self.capacity - len(self)
+                generator = torch.Generator().manual_seed(seed)
+                tasks = self.__chunk(free, seed, generator)
+                if executor is None:
+                    shards = [generate_seeded_shard(*task, sampler = self.sampler) for task in tasks]
+                else:
+                    shards = [future.result() for future in [executor.submit(generate_seeded_shard, *task) for task in tasks]]
+                index = self.sampler.index
+                positive = torch.cat([index.edge_index[:, int(index.ptr[start]):int(index.ptr[end])] for start, end, _ in tasks], dim = 1)
+                #Drop the negatives which are positive hyperedges
+                result = self.sampler.build_result(index, *[torch.cat(parts, dim = -1) for parts in zip(*shards)], positive = positive)
+                negatives = result.remove_positive_from_negative().n_edge_index
+                self.__yield = max(result.num_n_edges / sum(end - start for start, end, _ in tasks), 1 / self.capacity)
+                negatives = self.__shuffle(negatives, generator)
+                with self.__condition:
+                    if self.__stop:
+                        return
+                    self.__insert(negatives)
+                    self.num_rounds += 1
+                    self.__condition.notify_all()
+        except BaseException as error:
+            with self.__condition:
+                self.__error = error
+                self.__condition.notify_all()
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures = True)
+
+    def __chunk(self, free: int, seed: int, generator: torch.Generator) -> list:
+        #The hyperedges start to end, from a random one and wrapping around, with their seeds
+        num_hyperedges = self.sampler.index.num_hyperedges
+        size = min(max(math.ceil(free / self.__yield), 1), num_hyperedges)
+        start = int(torch.randint(num_hyperedges, (1,), generator = generator))
+        bounds = [(start, min(start + size, num_hyperedges)), (0, start + size - num_hyperedges)]
+        return [
+            (start, end, self.sampler.shard_seed(seed, s))
+            for s, (start, end) in enumerate(bounds) if end > start
+        ]
+
+    @staticmethod
+    def __shuffle(n_edge_index: Tensor, generator: torch.Generator) -> Tensor:
+        #Relabel the hyperedges in a random order, so that eviction ties are not positional
+        n_edge_index = n_edge_index.cpu()
+        num_edges = int(n_edge_index[1].max()) + 1 if n_edge_index.shape[1] > 0 else 0
+        order = torch.randperm(num_edges, generator = generator)
+        return torch.vstack([n_edge_index[0], order.to(n_edge_index.dtype)[n_edge_index[1].long()]])
+
+    def __insert(self, n_edge_index: Tensor) -> None:
+        #Group the new negatives by hyperedge, their ids are 0..n - 1
+        n_edge_index = n_edge_index[:, torch.argsort(n_edge_index[1], stable = True)].cpu()
+        counts = torch.bincount(n_edge_index[1].long())
+        self.__nodes = torch.cat([self.__nodes, n_edge_index[0]])
+        self.__ptr = torch.cat([self.__ptr, self.__ptr[-1] + torch.cumsum(counts, dim = 0)])
+        self.__uses = torch.cat([self.__uses, torch.zeros_like(counts)])
+        self.__inserted = torch.cat([self.__inserted, torch.full_like(counts, self.num_draws)])
+        self.__drawn = torch.cat([self.__drawn, torch.full_like(counts, self.num_draws)])
+        overflow = len(self) - self.capacity
+        if overflow > 0:
+            #Stable sort, on ties the negatives inserted first, in the shuffled order of their
+            #round, are evicted first
+            key = self.__inserted if self.eviction == "age" else self.__drawn
+            keep = torch.ones(len(self), dtype = torch.bool)
+            keep[torch.argsort(key, stable = True)[:overflow]] = False
+            self.num_evicted += overflow
+            self.__keep(keep)
+
+    def __keep(self, keep: Tensor) -> None:
+        counts = self.__ptr[1:] - self.__ptr[:-1]
+        self.__nodes = self.__nodes[keep[segment_ids(counts)]]
+        self.__ptr = segment_ptr(counts[keep])
+        self.__uses = self.__uses[keep]
+        self.__inserted = self.__inserted[keep]
+        self.__drawn = self.__drawn[keep]
+
+    def draw(self, num_negatives: int, timeout: float = None) -> Tensor:
+        """ Draw num_negatives distinct negatives uniformly from the pool, waiting for the
+            refills when it holds fewer, and return their edge_index with the ids
+            0..num_negatives - 1 in the index type of the sampler.
+
+            Args:
+                num_negatives (int): How many negatives to draw, at most capacity.
+                timeout (float, optional): How many seconds to wait for the refills, forever
+                    when None.
+                    (default: None)
+        """
+        if num_negatives > self.capacity:
+            raise ValueError("Cannot draw more negatives than the capacity of the pool")
+        self.start()
+        with self.__condition:
+            ready = self.__condition.wait_for(lambda: self.__error is not None or len(self) >= num_negatives, timeout)
+            if self.__error is not None:
+                raise self.__error
+            if not ready:
+                raise TimeoutError("The pool was not refilled in time")
+            picked = torch.randperm(len(self), generator = self.generator)[:num_negatives]
+            counts = self.__ptr[picked + 1] - self.__ptr[picked]
+            nodes = self.__nodes[torch.repeat_interleave(self.__ptr[picked], counts) + segment_arange(counts)]
+            self.num_draws += 1
+            self.__uses[picked] += 1
+            self.__drawn[picked] = self.num_draws
+            keep = torch.ones(len(self), dtype = torch.bool)
+            if self.max_reuse is not None:
+                keep &= self.__uses < self.max_reuse
+            if self.max_age is not None:
+                keep &= self.num_draws - self.__inserted < self.max_age
+            if not bool(keep.all()):
+                self.__keep(keep)
+                self.__condition.notify_all()
+        return torch.vstack([nodes, segment_ids(counts).to(nodes.dtype)])
+
+    def batch(self, edge_index: Tensor, ratio: float = 1) -> Tuple[Tensor, Tensor]:
+        """ Pair a batch of positive hyperedges with negatives drawn from the pool, in place
+            of oversampling the negatives of the batch: round(num positives * ratio) in all.
+
+            Args:
+                edge_index (Tensor): The positive hyperedges of the batch.
+                ratio (float, optional): How many negatives per positive hyperedge on
+                    average, a fractional ratio is rounded over the whole batch.
+                    (default: 1)
+                return: the edge_index of the positive hyperedges followed by the negative
+                    ones, relabeled in this order, and their labels.
+        """
+        p_ids, p_inverse = torch.unique(edge_index[1], return_inverse = True)
+        num_negatives = round(p_ids.shape[0] * ratio)
+        negatives = self.draw(num_negatives).to(edge_index.device, edge_index.dtype)
+        negatives[1] += p_ids.shape[0]
+        y = torch.cat([
+            torch.ones((p_ids.shape[0], 1), device = edge_index.device),
+            torch.zeros((num_negatives, 1), device = edge_index.device)
+        ])
+        return torch.hstack([torch.vstack([edge_index[0], p_inverse.to(edge_index.dtype)]), negatives]), y
@@ -0,0 +1,184 @@
+import contextlib
+import os
+import resource
+import threading
+import time
+import torch
+from collections import defaultdict
+from torch import Tensor
+from typing import Callable, Dict
+
+
+def resident_memory() -> int:
+    """ Return the resident set size of the process in bytes
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        #Peak of the process in KiB, only grows
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class NullProfiler():
+    """ The profiler of the samplers and results which are not profiled: every hook is a
+        no-op, so the instrumented hot paths only pay a method call.
+    """
+
+    enabled = False
+    __context = contextlib.nullcontext()
+
+    def stage(self, name: str):
+        return self.__context
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def sync(self, function: Callable, *args, **kwargs):
+        """ Call function, a host-device synchronization such as an op whose output size
+            depends on the values, and return its result. Every synchronization of the
+            samplers and of their results goes through sync, item or nonzero.
+        """
+        return function(*args, **kwargs)
+
+    def item(self, tensor: Tensor):
+        """ Return the value of a one-element tensor, a synchronization
+        """
+        return self.sync(tensor.item)
+
+    def nonzero(self, mask: Tensor) -> Tensor:
+        """ Return the positions of the True entries of a 1-D mask, a synchronization
+        """
+        return self.sync(torch.nonzero, mask).flatten()
+
+    def to_dict(self) -> dict:
+        return {"stages": {}, "counters": {}}
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class SamplerProfiler(NullProfiler):
+    """ Record where the time goes in a sampler and in its results: the wall time and the
+        peak memory of every stage, nested stages are named parent/child, and counters
+        such as the rejection retries and the host-device synchronizations ('syncs'),
+        counted by sync, item and nonzero.
+        Enable it with sampler.profile(), the results share their sampler's profiler.
+
+        Args:
+            callback (Callable, optional): Called with a dict holding the stage's name, its
+                wall time in seconds and its peak memory in bytes whenever a stage ends.
+                (default: None)
+            memory (bool, optional): Set True to measure the peak memory of every stage:
+                the allocator's peak on CUDA, the resident set size polled by a background
+                thread on the CPU, an upper bound since it includes the cached blocks.
+                (default: False)
+            device (torch.device, optional): The device whose work is synchronized before
+                reading the clock and whose memory is measured.
+                (default: None, the CPU)
+            interval (float, optional): The polling interval in seconds of the resident
+                set size.
+                (default: 0.0005)
+    """
+
+    enabled = True
+
+    def __init__(self, callback: Callable[[dict], None] = None, memory: bool = False, device: torch.device = None, interval: float = 0.0005):
+        self.callback = callback
+        self.memory = memory
+        self.device = torch.device("cpu") if device is None else torch.device(device)
+        self.interval = interval
+        self.reset()
+
+    def reset(self) -> None:
+        self.stages = defaultdict(lambda: {"calls": 0, "total_s": 0.0, "max_s": 0.0, "peak_bytes": 0})
+        self.counters = defaultdict(int)
+        self.__open = []
+        self.__lock = threading.Lock()
+        self.__poller = None
+
+    def __synchronize(self) -> None:
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+    def __memory(self) -> int:
+        if self.device.type == "cuda":
+            return torch.cuda.memory_allocated(self.device)
+        return resident_memory()
+
+    def __poll(self, stop: threading.Event) -> None:
+        while not stop.wait(self.interval):
+            used = resident_memory()
+            with self.__lock:
+                for frame in self.__open:
+                    frame["high"] = max(frame["high"], used)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if len(self.__open) > 0 and self.__open[-1]["leaf"] == name:
+            #An override entering the stage of the method it extends is part of the same stage
+            yield self
+            return
+        self.__synchronize()
+        frame = {"name": "/".join([f["name"] for f in self.__open[-1:]] + [name]), "leaf": name, "high": 0}
+        if self.memory:
+            if self.device.type == "cuda":
+                #The peak statistic is global, keep the peak reached so far by the enclosing stages
+                for parent in self.__open:
+                    parent["high"] = max(parent["high"], torch.cuda.max_memory_allocated(self.device))
+                torch.cuda.reset_peak_memory_stats(self.device)
+            frame["start"] = frame["high"] = self.__memory()
+        with self.__lock:
+            self.__open.append(frame)
+        if self.memory and self.device.type != "cuda" and self.__poller is None:
+            stop = threading.Event()
+            self.__poller = (threading.Thread(target = self.__poll, args = (stop,), daemon = True), stop)
+            self.__poller[0].start()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.__synchronize()
+            elapsed = time.perf_counter() - start
+            with self.__lock:
+                self.__open.pop()
+            peak = 0
+            if self.memory:
+                high = torch.cuda.max_memory_allocated(self.device) if self.device.type == "cuda" else resident_memory()
+                high = max(frame["high"], high)
+                peak = high - frame["start"]
+                if len(self.__open) > 0:
+                    self.__open[-1]["high"] = max(self.__open[-1]["high"], high)
+                elif self.__poller is not None:
+                    self.__poller[1].set()
+                    self.__poller[0].join()
+                    self.__poller = None
+            record = self.stages[frame["name"]]
+            record["calls"] += 1
+            record["total_s"] += elapsed
+            record["max_s"] = max(record["max_s"], elapsed)
+            record["peak_bytes"] = max(record["peak_bytes"], peak)
+            if self.callback is not None:
+                self.callback({"stage": frame["name"], "seconds": elapsed, "peak_bytes": peak})
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counters[name] += int(value)
+
+    def sync(self, function: Callable, *args, **kwargs):
+        self.counters["syncs"] += 1
+        return function(*args, **kwargs)
+
+    def to_dict(self) -> Dict[str, dict]:
+        """ Return the records of every stage and the counters as plain dicts
+        """
+        return {
+            "stages": {name: dict(record) for name, record in self.stages.items()},
+            "counters": dict(self.counters)
+        }
+
+    def __getstate__(self):
+        #The locks and the poller are not picklable, the copies sent to workers start empty
+        return {"callback": None, "memory": self.memory, "device": self.device, "interval": self.interval}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
@@ -0,0 +1,5 @@
+from .negative_sampling_pipeline import NegativeSamplingPipeline
+
+__all__ = data_classes = [
+    "NegativeSamplingPipeline"
+]
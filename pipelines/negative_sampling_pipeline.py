@@ -0,0 +1,87 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from torch import Tensor
+from typing import Iterator, Tuple
+from hyperlink_prediction.datasets import DatasetLoader
+from negative_sampling import HypergraphNegativeSampler, NegativePool
+from negative_sampling.hypergraph_negative_sampling import init_sampler_worker, seeded_sampler
+
+
+def _sample_batch(edge_index: Tensor, seed: int, sampler: HypergraphNegativeSampler = None) -> Tuple[Tensor, Tensor]:
+    """ Generate, from the fitted hypergraph, and clean the negatives of one positive batch
+        with its own seed
+    """
+    result = seeded_sampler(seed, sampler).generate_batch(edge_index).clean()
+    return result.edge_index, result.y
+
+
+class NegativeSamplingPipeline():
+    """ A pipeline stage which attaches a fitted negative sampler to a DatasetLoader: the
+        negatives of every positive batch are generated from the fitted hypergraph, see
+        generate_batch, and cleaned against all its hyperedges in worker processes, up to
+        prefetch batches ahead, so that sampling overlaps with the training compute.
+        A sampler which was never fitted is fitted on the loader's dataset, the workers
+        receive it with its index once. Batch i is always sampled with the seed seed + i,
+        the pairs are the same whatever the number of workers.
+
+        Args:
+            loader (DatasetLoader): The loader of the positive batches.
+            sampler (HypergraphNegativeSampler): The sampler generating the negatives.
+            num_workers (int, optional): How many processes generate negatives, 0 to
+                generate them on the main thread without overlap.
+                (default: 1)
+            prefetch (int, optional): How many batches are sampled ahead of the one
+                being consumed.
+                (default: 2)
+            seed (int, optional): The seed of the first batch.
+                (default: 0)
+            pool (NegativePool, optional): A pool the negatives are drawn from instead of
+                generating them per batch, sampler and num_workers are then unused.
+                (default: None)
+            ratio (float, optional): How many negatives per positive hyperedge are drawn
+                from the pool.
+                (default: 1)
+    """
+
+    def __init__(self, loader: DatasetLoader, sampler: HypergraphNegativeSampler, num_workers: int = 1, prefetch: int = 2, seed: int = 0, pool: NegativePool = None, ratio: float = 1):
+        self.loader = loader
+        self.sampler = sampler
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.seed = seed
+        self.pool = pool
+        self.ratio = ratio
+        if pool is None:
+            if sampler.index is None:
+                sampler.fit(loader.dataset.edge_index)
+            sampler.prepare(sampler.index)
+
+    def __len__(self) -> int:
+        return len(self.loader)
+
+    def __iter__(self) -> Iterator[Tuple[Tensor, Tensor]]:
+        """ Yield, for every positive batch, the edge_index of its positive and negative
+            hyperedges and their labels
+        """
+        if self.pool is not None:
+            for edge_index, _ in self.loader:
+                yield self.pool.batch(edge_index, self.ratio)
+            return
+
+        if self.num_workers <= 0:
+            for i, (edge_index, _) in enumerate(self.loader):
+                yield _sample_batch(edge_index, self.seed + i, self.sampler)
+            return
+
+        with ProcessPoolExecutor(self.num_workers, initializer = init_sampler_worker, initargs = (self.sampler,)) as executor:
+            pending = deque()
+            try:
+                for i, (edge_index, _) in enumerate(self.loader):
+                    pending.append(executor.submit(_sample_batch, edge_index, self.seed + i))
+                    if len(pending) > self.prefetch:
+                        yield pending.popleft().result()
+                while len(pending) > 0:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
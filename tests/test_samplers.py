@@ -0,0 +1,79 @@
+import pytest
+import torch
+from negative_sampling import (
+    ABSizedHypergraphNegativeSampler,
+    CliqueHypergraphNegativeSampler,
+    HyperedgeSet,
+    MotifHypergraphNegativeSampler
+)
+
+NUM_NODE = 120
+SAMPLERS = {
+    "absized": lambda: ABSizedHypergraphNegativeSampler(NUM_NODE, 0.5, 2, generator = 0),
+    "absized-hyperedge": lambda: ABSizedHypergraphNegativeSampler(NUM_NODE, 2, 1, ABSizedHypergraphNegativeSampler.Mode.HYPEREDGE_AWARE, generator = 0),
+    "absized-bucketed": lambda: ABSizedHypergraphNegativeSampler(NUM_NODE, 0.5, 2, generator = 0, bucketed = True),
+    "motif": lambda: MotifHypergraphNegativeSampler(NUM_NODE, generator = 0),
+    "clique": lambda: CliqueHypergraphNegativeSampler(NUM_NODE, generator = 0),
+}
+
+
+def random_hypergraph(num_hyperedges: int, seed: int = 0) -> torch.Tensor:
+    #Hyperedges of 2 to 5 distinct nodes, sorted by hyperedge
+    generator = torch.Generator().manual_seed(seed)
+    hyperedges = []
+    for i in range(num_hyperedges):
+        size = int(torch.randint(2, 6, (1,), generator = generator))
+        nodes = torch.randperm(NUM_NODE, generator = generator)[:size]
+        hyperedges.append(torch.vstack([nodes, torch.full_like(nodes, i)]))
+    return torch.hstack(hyperedges)
+
+
+def negatives(result) -> torch.Tensor:
+    return result.edge_index[:, result.edge_index[1] >= result.num_p_edges]
+
+
+@pytest.fixture(scope = "module")
+def edge_index() -> torch.Tensor:
+    return random_hypergraph(400)
+
+
+@pytest.mark.parametrize("name", SAMPLERS)
+def test_sharded_is_independent_of_workers(name, edge_index):
+    results = [
+        SAMPLERS[name]().generate_sharded(edge_index, 4, seed = 3, num_workers = num_workers)
+        for num_workers in (0, 2)
+    ]
+    assert torch.equal(results[0].n_edge_index, results[1].n_edge_index)
+
+
+@pytest.mark.parametrize("num_shards", [0, -1])
+def test_sharded_rejects_no_shards(num_shards, edge_index):
+    with pytest.raises(ValueError):
+        SAMPLERS["absized"]().generate_sharded(edge_index, num_shards)
+
+
+@pytest.mark.parametrize("name", SAMPLERS)
+def test_clean_removes_positives(name, edge_index):
+    result = SAMPLERS[name]().generate(edge_index).clean()
+    assert result.num_n_edges > 0
+    assert not HyperedgeSet(edge_index, NUM_NODE).contains(negatives(result)).any()
+
+
+@pytest.mark.parametrize("name", SAMPLERS)
+def test_update_removes_positives(name, edge_index):
+    sampler = SAMPLERS[name]()
+    split = int((edge_index[1] < 300).sum())
+    sampler.fit(edge_index[:, :split])
+    result = sampler.update(edge_index[:, split:]).clean()
+    assert result.num_p_edges == 100
+    #The appended hyperedges and the fitted ones are all positives
+    assert not HyperedgeSet(edge_index, NUM_NODE).contains(negatives(result)).any()
+
+
+@pytest.mark.parametrize("name", SAMPLERS)
+def test_update_without_hyperedges(name, edge_index):
+    sampler = SAMPLERS[name]().fit(edge_index)
+    result = sampler.update(edge_index[:, :0])
+    assert result.num_p_edges == 0
+    assert result.num_n_edges == 0
+    assert sampler.generate_batch(edge_index[:, :0]).num_n_edges == 0
@@ -0,0 +1,48 @@
+import torch
+from torch import Tensor
+from typing import List, Tuple
+
+
+def size_buckets(sizes: Tensor, exact: int = None) -> List[Tuple[int, Tensor]]:
+    """ Group the positions of sizes in buckets of equal or binned size: every size up to
+        exact has its own bucket, the larger ones share power of two ranges (exact, 2^i].
+
+        Args:
+            sizes (Tensor): The size of every element, such as the hyperedge's degrees.
+            exact (int, optional): The largest size with a bucket of its own, every size
+                when None.
+                (default: None)
+            return: the width of every bucket, its largest size, with the positions of its
+                elements in increasing order, by increasing width.
+    """
+    key = sizes
+    if exact is not None:
+        #Sizes above exact are keyed by the power of two closing their range
+        ceiling = torch.pow(2, torch.ceil(torch.log2(sizes.clamp(min = 1).double()))).long()
+        key = torch.where(sizes <= exact, sizes, ceiling.clamp(min = exact + 1))
+    order = torch.argsort(key, stable = True)
+    keys, counts = torch.unique_consecutive(key[order], return_counts = True)
+    buckets = []
+    for ids in torch.split(order, counts.tolist()):
+        buckets.append((int(sizes[ids].max()), ids))
+    return buckets
+
+
+def dense_rows(values: Tensor, ptr: Tensor, ids: Tensor, width: int, fill: int = -1) -> Tuple[Tensor, Tensor]:
+    """ Gather the segments ids of values, whose CSR offsets are ptr, as the rows of a
+        (len(ids), width) matrix padded with fill.
+
+        Args:
+            values (Tensor): The values grouped by segment.
+            ptr (Tensor): The CSR offsets of the segments in values.
+            ids (Tensor): The segments to gather, one per row.
+            width (int): The number of columns, at least the largest gathered segment.
+            fill (int, optional): The value of the padding.
+                (default: -1)
+            return: the matrix and the positions in values of its entries, -1 for the padding.
+    """
+    column = torch.arange(width, device = values.device)
+    positions = ptr[ids].view(-1, 1) + column
+    positions = torch.where(column < (ptr[ids + 1] - ptr[ids]).view(-1, 1), positions, -1)
+    rows = torch.where(positions >= 0, values[positions.clamp(min = 0)], fill)
+    return rows, positions
@@ -0,0 +1,32 @@
+import torch
+
+#The integer types an edge_index may be stored with, from the most compact
+INDEX_DTYPES = (torch.int32, torch.int64)
+
+
+def index_dtype(*bounds: int) -> torch.dtype:
+    """ Return the most compact index type holding every value below the given bounds
+
+        Args:
+            *bounds (int): The exclusive upper bounds of the values, such as the number of
+                nodes and of hyperedges.
+    """
+    for dtype in INDEX_DTYPES:
+        if all(bound <= torch.iinfo(dtype).max + 1 for bound in bounds):
+            return dtype
+    raise ValueError("The values do not fit in any index type")
+
+
+def check_index_dtype(dtype: torch.dtype, *bounds: int) -> torch.dtype:
+    """ Check that dtype is an index type holding every value below the given bounds and
+        return it
+
+        Args:
+            dtype (torch.dtype): One of INDEX_DTYPES.
+            *bounds (int): The exclusive upper bounds of the values.
+    """
+    if dtype not in INDEX_DTYPES:
+        raise ValueError(f"The index type must be one of {INDEX_DTYPES}, not {dtype}")
+    if any(bound > torch.iinfo(dtype).max + 1 for bound in bounds):
+        raise ValueError(f"The values do not fit in {dtype}, use {index_dtype(*bounds)}")
+    return dtype
@@ -0,0 +1,35 @@
+from torch import Tensor
+
+
+class GrowableTensor():
+    """ A tensor which grows by appending along its last dimension. The storage doubles
+        when it is full, so every appended element is copied O(1) times on average, and
+        the tensor is a view on the used part of the storage.
+
+        Args:
+            tensor (Tensor): The initial content.
+    """
+
+    def __init__(self, tensor: Tensor):
+        self.__storage = tensor
+        self.__length = tensor.shape[-1]
+
+    def __len__(self) -> int:
+        return self.__length
+
+    @property
+    def tensor(self) -> Tensor:
+        return self.__storage[..., :self.__length]
+
+    def append(self, values: Tensor) -> Tensor:
+        """ Append values after the current content and return the grown tensor, the
+            tensors returned before stay valid but do not see the new values.
+        """
+        needed = self.__length + values.shape[-1]
+        if needed > self.__storage.shape[-1]:
+            storage = self.__storage.new_empty((*self.__storage.shape[:-1], max(needed, 2 * self.__storage.shape[-1])))
+            storage[..., :self.__length] = self.tensor
+            self.__storage = storage
+        self.__storage[..., self.__length:needed] = values
+        self.__length = needed
+        return self.tensor
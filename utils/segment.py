@@ -0,0 +1,88 @@
+import torch
+from torch import Tensor
+
+
+def segment_ptr(counts: Tensor) -> Tensor:
+    """ Return the CSR offsets of a list of contiguous segments
+
+        Args:
+            counts (Tensor): The number of elements in each segment.
+            return: a tensor of size len(counts) + 1 where the i-th segment
+                spans the positions [ptr[i], ptr[i + 1]).
+    """
+    ptr = torch.zeros(counts.shape[0] + 1, dtype = torch.long, device = counts.device)
+    torch.cumsum(counts, dim = 0, out = ptr[1:])
+    return ptr
+
+
+def segment_ids(counts: Tensor, total: int = None) -> Tensor:
+    """ Return, for every element, the id of the contiguous segment it belongs to
+
+        Args:
+            counts (Tensor): The number of elements in each segment.
+            total (int, optional): The sum of counts, read from the device when None,
+                which synchronizes it.
+                (default: None)
+    """
+    return torch.repeat_interleave(
+        torch.arange(counts.shape[0], device = counts.device),
+        counts,
+        output_size = total
+    )
+
+
+def segment_arange(counts: Tensor, total: int = None) -> Tensor:
+    """ Return, for every element, its position inside its own contiguous segment
+
+        Args:
+            counts (Tensor): The number of elements in each segment.
+            total (int, optional): The sum of counts, read from the device when None,
+                which synchronizes it.
+                (default: None)
+    """
+    ptr = segment_ptr(counts)
+    if total is None:
+        total = int(ptr[-1])
+    return torch.arange(total, device = counts.device) - torch.repeat_interleave(ptr[:-1], counts, output_size = total)
+
+
+def sorted_isin(elements: Tensor, sorted_keys: Tensor) -> Tensor:
+    """ Return a mask telling which elements appear in sorted_keys, through a binary search
+
+        Args:
+            elements (Tensor): The values to look up.
+            sorted_keys (Tensor): A sorted 1-D tensor of keys.
+    """
+    if sorted_keys.shape[0] == 0:
+        return torch.zeros_like(elements, dtype = torch.bool)
+    position = torch.searchsorted(sorted_keys, elements).clamp_(max = sorted_keys.shape[0] - 1)
+    return sorted_keys[position] == elements
+
+
+def segment_argmin(values: Tensor, counts: Tensor) -> Tensor:
+    """ Return, for every non-empty contiguous segment, the position inside the segment
+        of its smallest value
+
+        Args:
+            values (Tensor): A 1-D tensor ordered by segment.
+            counts (Tensor): The number of elements in each segment.
+    """
+    ids = segment_ids(counts, values.shape[0])
+    #Sort by value then, stably, by segment: the first element of every segment is its minimum
+    order = torch.argsort(values, stable = True)
+    order = order[torch.argsort(ids[order], stable = True)]
+    return order[segment_ptr(counts)[:-1]] - segment_ptr(counts)[:-1]
+
+
+def random_below(bounds: Tensor, generator: torch.Generator = None) -> Tensor:
+    """ Draw, for every bound, a uniformly random integer in [0, bound). The draw is made
+        in float64 so that it stays below its bound for any bound up to 2^53,
+        which float32 only guarantees up to 2^24.
+
+        Args:
+            bounds (Tensor): The positive exclusive upper bounds.
+            generator (torch.Generator, optional): The generator of the draws.
+                (default: None)
+    """
+    u = torch.rand(bounds.shape, dtype = torch.float64, generator = generator, device = bounds.device)
+    return (u * bounds).long()